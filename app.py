@@ -1,95 +1,30 @@
 import streamlit as st
-import pandas as pd
-import re
-import io
-import time
-import os
-import cv2
-import numpy as np
-import zxingcpp
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy.sql import func
-from PIL import Image
+from types import SimpleNamespace
+from sqlalchemy.exc import SQLAlchemyError
+from metricas import medir, resumo_latencias, resumo_banco, zerar_latencias, exportar_prometheus, gravar_arquivo_prometheus
+from cache import estatisticas_caches
+import escrita
+from visao import ler_codigo
 
 # --- CONFIGURAÇÃO INICIAL ---
 st.set_page_config(page_title="Sistema PMP Fluxo Contínuo", layout="wide", page_icon="🏭")
 
 # --- BANCO DE DADOS ---
 try:
-    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///sistema_local.db")
-    engine = create_engine(DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    Base = declarative_base()
+    from modelos import Session, Usuario, Pedido, ItemPedido
+    from servicos import (carregar_detalhe_pedido, registrar_tempo, ultimo_evento_tempo,
+                          liberar_pedido, pedidos_para_separacao, enviar_para_conferencia, aguardando_conferencia,
+                          pedidos_para_conferencia, aprovar_conferencia, recusar_conferencia, registrar_divergencia, marcar_lancamento_erp, marcar_lancamentos_erp, concluir_pedido)
+    from tarefas import submeter, listar_tarefas, resultado_tarefa
+    from autenticacao import emitir_token, usuario_do_token, revogar_tokens
+    from distribuicao import DISTRIBUICAO_MODO, sugerir_pedido, plano_distribuicao
+    import fila_local
+    fila_local.iniciar()
 except Exception as e:
     st.error(f"❌ Erro fatal na configuração do Banco: {e}")
     st.stop()
 
-# --- MODELOS ---
-class Usuario(Base):
-    __tablename__ = 'usuarios'
-    id = Column(Integer, primary_key=True)
-    username = Column(String, unique=True)
-    senha = Column(String)
-    perfil = Column(String)
-
-class Pedido(Base):
-    __tablename__ = 'pedidos'
-    id = Column(Integer, primary_key=True)
-    numero_pedido = Column(String)
-    data_pedido = Column(String)
-    status = Column(String)
-    criado_em = Column(DateTime, default=datetime.now)
-    data_conclusao = Column(DateTime, nullable=True)
-    itens = relationship("ItemPedido", back_populates="pedido", cascade="all, delete")
-    logs = relationship("LogTempo", back_populates="pedido", cascade="all, delete")
-
-class ItemPedido(Base):
-    __tablename__ = 'itens_pedido'
-    id = Column(Integer, primary_key=True)
-    pedido_id = Column(Integer, ForeignKey('pedidos.id'))
-    codigo = Column(String)
-    descricao = Column(String)
-    unidade = Column(String)
-    qtd_solicitada = Column(Float)
-    justificativa_divergencia = Column(Text, nullable=True)
-    item_adicionado_manualmente = Column(Boolean, default=False)
-    pedido = relationship("Pedido", back_populates="itens")
-    separacoes = relationship("Separacao", back_populates="item", cascade="all, delete")
-
-class Separacao(Base):
-    __tablename__ = 'separacoes'
-    id = Column(Integer, primary_key=True)
-    item_id = Column(Integer, ForeignKey('itens_pedido.id'))
-    rastreabilidade = Column(String)
-    qtd_separada = Column(Float)
-    
-    # --- NOVO CAMPO: Quantidade contada pelo conferente ---
-    qtd_conferida = Column(Float, nullable=True)
-    
-    separador_id = Column(Integer, ForeignKey('usuarios.id'))
-    registrado_em = Column(DateTime, default=datetime.now)
-    enviado_conferencia = Column(Boolean, default=False)
-    conferido = Column(Boolean, default=False)
-    motivo_rejeicao = Column(Text, nullable=True)
-    enviado_sistema = Column(Boolean, default=False)
-    data_envio = Column(DateTime, nullable=True)
-    item = relationship("ItemPedido", back_populates="separacoes")
-
-class LogTempo(Base):
-    __tablename__ = 'logs_tempo'
-    id = Column(Integer, primary_key=True)
-    pedido_id = Column(Integer, ForeignKey('pedidos.id'))
-    usuario_id = Column(Integer, ForeignKey('usuarios.id'))
-    acao = Column(String)
-    timestamp = Column(DateTime, default=datetime.now)
-    pedido = relationship("Pedido", back_populates="logs")
-
-# --- CRIAÇÃO DAS TABELAS ---
-try: Base.metadata.create_all(engine)
-except: pass
-
 # --- FUNÇÕES AUXILIARES ---
 def get_db():
     if 'db' not in st.session_state: st.session_state.db = Session()
@@ -103,43 +38,6 @@ def init_users():
             s.commit()
     except: pass
 
-def encerrar_cronometros_abertos(session, pedido_id):
-    logs = session.query(LogTempo).filter_by(pedido_id=pedido_id).all()
-    user_logs = {}
-    for log in logs:
-        if log.usuario_id not in user_logs: user_logs[log.usuario_id] = []
-        user_logs[log.usuario_id].append(log)
-    for uid, ulogs in user_logs.items():
-        ulogs.sort(key=lambda x: x.timestamp)
-        if ulogs and ulogs[-1].acao == "INICIO":
-            session.add(LogTempo(pedido_id=pedido_id, usuario_id=uid, acao="FIM", timestamp=datetime.now()))
-    session.commit()
-
-def calcular_tempos_reais(session, pedido_id):
-    logs = session.query(LogTempo).filter_by(pedido_id=pedido_id).order_by(LogTempo.timestamp).all()
-    tempos = {}
-    status_atual = {}
-    user_logs = {}
-    for log in logs:
-        if log.usuario_id not in user_logs: user_logs[log.usuario_id] = []
-        user_logs[log.usuario_id].append(log)
-    for uid, ulogs in user_logs.items():
-        total = timedelta(0)
-        inicio_periodo = None
-        for log in ulogs:
-            if log.acao == "INICIO":
-                inicio_periodo = log.timestamp
-                status_atual[uid] = 'RODANDO'
-            elif (log.acao == "PAUSA" or log.acao == "FIM"):
-                if inicio_periodo:
-                    total += (log.timestamp - inicio_periodo)
-                    inicio_periodo = None
-                status_atual[uid] = 'PARADO'
-        if inicio_periodo:
-            total += (datetime.now() - inicio_periodo)
-        tempos[uid] = total
-    return tempos, status_atual
-
 def formatar_delta(delta):
     if not delta: return "00:00:00"
     total_seconds = int(delta.total_seconds())
@@ -147,63 +45,88 @@ def formatar_delta(delta):
     minutes, seconds = divmod(remainder, 60)
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
-def processar_arquivo_robusto(uploaded_file):
-    df_raw = None
-    try: df_raw = pd.read_excel(uploaded_file, header=None, dtype=str)
-    except:
-        try: uploaded_file.seek(0); content = uploaded_file.getvalue().decode('latin-1')
-        except: content = uploaded_file.getvalue().decode('utf-8')
-        df_raw = pd.DataFrame([line.split(',') for line in content.split('\n')])
-
-    data_ped, num_ped = "", "SEM_NUMERO"
-    itens = []
-    reading = False
-    reg_data = re.compile(r'(\d{2}/\d{2}/\d{4})')
-    reg_ped = re.compile(r'(?<!\d)(\d{5,6})(?!\d)')
-
-    for row in df_raw.itertuples(index=False):
-        row_clean = [str(x).strip() for x in row if str(x).lower() not in ['nan', 'none', '', 'nat']]
-        line_str = " ".join(row_clean)
-        if "Data" in line_str and not data_ped:
-            m = reg_data.search(line_str)
-            if m: data_ped = m.group(1)
-        if "Pedido" in line_str and "SEM_NUMERO" in num_ped:
-            m = reg_ped.search(line_str)
-            if m: num_ped = m.group(1)
-        if "TOTAIS" in line_str.replace(" ", "").upper(): reading = True; continue
-        if reading and len(row_clean) >= 3:
-            first = row_clean[0].replace('"', '')
-            last = row_clean[-1].replace('"', '').replace(',', '.')
-            if first.isdigit():
-                try: itens.append({"cod": first, "desc": " ".join(row_clean[1:-1]), "und": row_clean[-2] if len(row_clean)>=4 else "UN", "qtd": float(last)})
-                except: continue
-    return itens, num_ped, data_ped
-
-# --- LEITURA PODEROSA COM ZXING ---
-def tentar_ler_codigo_robustamente(uploaded_image):
-    try:
-        file_bytes = np.asarray(bytearray(uploaded_image.read()), dtype=np.uint8)
-        img = cv2.imdecode(file_bytes, 1)
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        results = zxingcpp.read_barcodes(img_rgb)
-        if results: return results[0].text
-
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
-        
-        results_gray = zxingcpp.read_barcodes(enhanced)
-        if results_gray: return results_gray[0].text
-
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        results_bin = zxingcpp.read_barcodes(binary)
-        if results_bin: return results_bin[0].text
-            
-        return None
-    except Exception as e:
-        print(f"Erro ZXing: {e}")
-        return None
+# --- PAGINAÇÃO DE ITENS (custo de render limitado ao tamanho da página, não ao pedido) ---
+TAMANHOS_PAGINA = [25, 50, 100, 200]
+
+def paginar_itens(linhas, chave, pendente, codigo, com_grade=True):
+    """Filtros (pendentes / prefixo do código) e paginação. Devolve (linhas da página, modo grade?).
+    Sem `pendente`, o filtro de pendentes não é oferecido."""
+    c1, c2, c3, c4, c5 = st.columns([2, 2, 1, 1, 1])
+    so_pend = c1.toggle("Somente pendentes", key=f"{chave}_pend") if pendente else False
+    prefixo = c2.text_input("Código começa com", key=f"{chave}_pref").strip()
+    tam = c3.selectbox("Por página", TAMANHOS_PAGINA, index=1, key=f"{chave}_tam")
+    filtradas = [l for l in linhas if (not so_pend or pendente(l)) and str(codigo(l) or "").startswith(prefixo)]
+    paginas = max(1, -(-len(filtradas) // tam))
+    if st.session_state.get(f"{chave}_pag", 1) > paginas: st.session_state[f"{chave}_pag"] = paginas
+    pag = c4.number_input("Página", min_value=1, max_value=paginas, step=1, key=f"{chave}_pag")
+    grade = c5.toggle("Grade", key=f"{chave}_grade") if com_grade else False
+    st.caption(f"{len(filtradas)} de {len(linhas)} itens · página {pag}/{paginas}")
+    return filtradas[(pag - 1) * tam: pag * tam], grade
+
+def status_conferencia(sep):
+    if sep.motivo_rejeicao: return "RECUSADO"
+    if sep.conferido: return "CONFERIDO"
+    if sep.enviado_conferencia: return "NA CONFERÊNCIA"
+    return "NA SEPARAÇÃO"
+
+def campo_justificativa(s, it, rotulo="Justificativa"):
+    j = st.text_input(rotulo, value=it.justificativa_divergencia or "", key=f"j_{it.id}")
+    if j != (it.justificativa_divergencia or ""): it.justificativa_divergencia = j; s.commit()
+
+# --- TAREFAS EM SEGUNDO PLANO (acompanhamento) ---
+ICONES_TAREFA = {"PENDENTE": "🕓", "EXECUTANDO": "⚙️", "CONCLUIDA": "✅", "ERRO": "❌"}
+
+def painel_tarefas(s, tipos, chave):
+    """Últimas tarefas dos `tipos`: andamento (atualizado a cada rerun/🔄) e download do resultado.
+    O arquivo só é lido quando o ADM pede aquele resultado, e só um por painel fica carregado."""
+    tarefas = listar_tarefas(s, tipos)
+    if not tarefas: return
+    c1, c2 = st.columns([4, 1])
+    c1.markdown("**Tarefas em segundo plano**")
+    c2.button("🔄 Atualizar", key=f"atualizar_{chave}")
+    for t in tarefas:
+        c1, c2, c3 = st.columns([2, 3, 1])
+        c1.text(f"{ICONES_TAREFA.get(t.status, '')} #{t.id} {t.criado_em:%d/%m %H:%M:%S}")
+        if t.status == "ERRO": c2.error(t.erro)
+        elif t.status == "CONCLUIDA": c2.caption(t.mensagem)
+        else: c2.progress(t.progresso or 0.0, text=t.mensagem)
+        if t.status == "CONCLUIDA" and t.nome_resultado:
+            escolhida = f"baixar_{chave}"
+            if st.session_state.get(escolhida) != t.id and c3.button("⬇️", key=f"preparar_{chave}_{t.id}", help=t.nome_resultado):
+                st.session_state[escolhida] = t.id
+            if st.session_state.get(escolhida) == t.id:
+                dados = resultado_tarefa(s, t.id)
+                if dados is None: c3.caption("Expirado")
+                else: c3.download_button("💾", dados, t.nome_resultado, key=f"baixar_{chave}_{t.id}", help=t.nome_resultado, type="primary")
+
+# --- AVISOS APÓS RERUN (substituem o time.sleep antes do st.rerun) ---
+def rerun_com_aviso(msg, icon="✅", baloes=False):
+    st.session_state['_aviso'] = (msg, icon, baloes)
+    st.rerun()
+
+def mostrar_aviso_pendente():
+    aviso = st.session_state.pop('_aviso', None)
+    if aviso:
+        msg, icon, baloes = aviso
+        st.toast(msg, icon=icon)
+        if baloes: st.balloons()
+
+# --- SESSÃO SEM ESTADO NA RÉPLICA (token assinado na URL) ---
+def restaurar_login():
+    """Nova sessão (F5, reconexão em outra réplica): reconstrói o usuário a partir do token da URL."""
+    if 'user' in st.session_state or "t" not in st.query_params: return
+    user = usuario_do_token(get_db(), st.query_params["t"])
+    if user: st.session_state['user'] = user
+    else: del st.query_params["t"]
+
+def sair():
+    # Descarrega antes de sair; se o banco falhar, a thread da fila tenta de novo
+    fila_local.sincronizar(get_db(), forcar=True)
+    u = st.session_state.pop('user', None)
+    if u:
+        try: revogar_tokens(get_db(), u)
+        except Exception as e: get_db().rollback(); print(f"Erro ao revogar token: {e}")
+    st.query_params.clear()
 
 # --- TELAS ---
 def login_screen():
@@ -216,61 +139,63 @@ def login_screen():
                 s = get_db()
                 try:
                     user = s.query(Usuario).filter_by(username=u, senha=p).first()
-                    if user: st.session_state['user'] = user; st.rerun()
+                    if user:
+                        st.session_state['user'] = user
+                        st.query_params["t"] = emitir_token(user); st.rerun()
                     else: st.error("Dados inválidos")
                 except Exception as e: st.error(f"Erro: {e}")
 
 def adm_screen():
+    # pandas carregado só quando um ADM abre o painel; leitura e geração de planilhas rodam nas tarefas
+    import pandas as pd
     s = get_db()
     st.title(f"Painel Gerencial (ADM: {st.session_state['user'].username})")
     
     qv = s.query(Pedido).filter(Pedido.status == 'VALIDACAO').count()
     qa = s.query(Pedido).filter(Pedido.status == 'EM_ANDAMENTO').count()
     
-    t1, t2, t3, t4 = st.tabs(["📥 Importar", f"🛡️ Validação ({qv})", f"🏭 Gestão Contínua ({qa})", "👥 Usuários"])
+    t1, t2, t3, t4, t5, t6 = st.tabs(["📥 Importar", f"🛡️ Validação ({qv})", f"🏭 Gestão Contínua ({qa})", "👥 Usuários", "📈 Desempenho", "📤 Exportação BI"])
 
-    with t1:
+    with t1, medir("aba:importar"):
         f = st.file_uploader("Arquivo PMP", type=["xls", "csv"])
         if f and st.button("Processar"):
-            itens, num, dat = processar_arquivo_robusto(f)
-            if itens:
-                if s.query(Pedido).filter_by(numero_pedido=num).first(): st.error("Existe!")
-                else:
-                    ped = Pedido(numero_pedido=num, data_pedido=dat, status="VALIDACAO")
-                    s.add(ped); s.flush()
-                    for i in itens: s.add(ItemPedido(pedido_id=ped.id, codigo=i['cod'], descricao=i['desc'], unidade=i['und'], qtd_solicitada=i['qtd']))
-                    s.commit(); st.success(f"Pedido {num} na Validação!")
-            else: st.error("Erro leitura")
+            submeter(s, "importar_pmp", f.getvalue(), {"nome": f.name}, st.session_state['user'].id)
+            st.toast(f"{f.name} enviado para processamento.", icon="📥")
+        painel_tarefas(s, ["importar_pmp"], "imp")
 
-    with t2:
+    with t2, medir("aba:validacao"):
         validacoes = s.query(Pedido).filter(Pedido.status == 'VALIDACAO').all()
         if not validacoes: st.caption("Vazio.")
         else:
             pid = st.selectbox("Limpar:", [p.id for p in validacoes], format_func=lambda x: next((f"{p.numero_pedido}" for p in validacoes if p.id==x), x))
             pval = s.query(Pedido).get(pid)
             dval = pd.DataFrame([{"ID": i.id, "Código": i.codigo, "Descrição": i.descricao, "Qtd": i.qtd_solicitada, "Manter?": True} for i in pval.itens])
-            edf = st.data_editor(dval, num_rows="dynamic", column_config={"ID": st.column_config.NumberColumn(disabled=True), "Manter?": st.column_config.CheckboxColumn(default=True)}, hide_index=True, key="ev")
+            edf = st.data_editor(dval, num_rows="dynamic", column_config={"ID": st.column_config.NumberColumn(disabled=True), "Código": st.column_config.TextColumn(required=True),
+                                 "Qtd": st.column_config.NumberColumn(required=True, min_value=0.001), "Manter?": st.column_config.CheckboxColumn(default=True)}, hide_index=True, key="ev")
             c1, c2 = st.columns(2)
             if c1.button("🗑️ Excluir"): s.delete(pval); s.commit(); st.rerun()
             if c2.button("🚀 Liberar p/ Produção"):
-                itens_banco = {i.id: i for i in pval.itens}; ids_manter = []
-                for index, row in edf.iterrows():
-                    if row.get("Manter?", True):
-                        rid = row.get("ID")
-                        if pd.isna(rid): s.add(ItemPedido(pedido_id=pval.id, codigo=str(row["Código"]), descricao=str(row["Descrição"]), unidade="UN", qtd_solicitada=float(row["Qtd"])))
-                        else: ids_manter.append(int(rid))
-                for db_id, db_item in itens_banco.items():
-                    if db_id not in ids_manter: s.delete(db_item)
-                pval.status = "EM_ANDAMENTO"; s.commit(); st.success("Liberado!"); time.sleep(1); st.rerun()
-
-    with t3:
+                with medir("liberar_producao"):
+                    try: r = liberar_pedido(s, pval, edf)
+                    except ValueError as e: st.error(str(e)); st.stop()
+                    rerun_com_aviso(f"Liberado! ({r['removidos']} removidos, {r['alterados']} alterados, {r['novos']} novos)", "🚀")
+
+    with t3, medir("aba:gestao_continua"):
         peds_ativos = s.query(Pedido).filter(Pedido.status == 'EM_ANDAMENTO').order_by(Pedido.id.desc()).all()
         peds_concluidos = s.query(Pedido).filter(Pedido.status == 'CONCLUIDO').order_by(Pedido.id.desc()).limit(5).all()
         lista_peds = peds_ativos + peds_concluidos
         if not lista_peds: st.info("Nenhum pedido.")
+        if peds_ativos:
+            with st.expander("🧭 Distribuição dos Separadores", expanded=False):
+                fila_peds, proximos = plano_distribuicao(s)
+                st.caption(f"Equipe máxima por pedido e pedido que termina primeiro com cada separador parado. Modo: {DISTRIBUICAO_MODO}.")
+                if fila_peds: st.dataframe(fila_peds, hide_index=True, use_container_width=True)
+                if proximos: st.dataframe(proximos, hide_index=True, use_container_width=True)
+                else: st.caption("Nenhum separador parado com pedido a sugerir.")
         pid = st.selectbox("Selecione Pedido", [p.id for p in lista_peds], format_func=lambda x: next((f"{p.numero_pedido} [{p.status}]" for p in lista_peds if p.id==x), x))
-        ped = s.query(Pedido).get(pid)
-        if ped:
+        det = carregar_detalhe_pedido(s, pid) if pid else None
+        if det:
+            ped = det.pedido
             st.divider()
             c_head, c_btn_reopen = st.columns([4, 1])
             c_head.markdown(f"### 🏭 Pedido: {ped.numero_pedido} | Status: {ped.status}")
@@ -278,13 +203,13 @@ def adm_screen():
                 if c_btn_reopen.button("🔓 Reabrir", type="primary"):
                     ped.status = "EM_ANDAMENTO"; ped.data_conclusao = None; s.commit(); st.rerun()
             
-            tempos_individuais, status_live = calcular_tempos_reais(s, ped.id)
+            tempos_individuais = det.tempos
             tempo_equipe_str = formatar_delta(sum(tempos_individuais.values(), timedelta(0)))
             with st.expander("⏱️ Tempos da Equipe", expanded=False):
                 st.metric("Total Equipe", tempo_equipe_str)
                 cols = st.columns(4); idx=0
                 for uid, delta in tempos_individuais.items():
-                     unome = s.query(Usuario).get(uid).username
+                     unome = det.nomes.get(uid, uid)
                      cols[idx%4].text(f"{unome}: {formatar_delta(delta)}")
                      idx+=1
 
@@ -296,75 +221,83 @@ def adm_screen():
                          if c4.form_submit_button("Add") and nc:
                              s.add(ItemPedido(pedido_id=ped.id, codigo=nc, descricao=nd, unidade="UN", qtd_solicitada=nq, item_adicionado_manualmente=True)); s.commit(); st.rerun()
 
-            pendencias_lancamento = 0
-            pendencias_separacao = 0
-            
-            for it in ped.itens:
-                tot_sep = sum([sep.qtd_separada for sep in it.separacoes])
-                meta = it.qtd_solicitada
+            pagina, grade = paginar_itens(det.itens, "pag_adm", pendente=lambda d: d.tot_sep != d.meta or any(not sp.motivo_rejeicao and not sp.enviado_sistema for sp in d.separacoes), codigo=lambda d: d.item.codigo)
+            if grade:
+                # Uma tabela editável por página, uma linha por lote: só a coluna "Lançado" é editável.
+                # Itens sem lote ficam numa tabela à parte, só leitura (o data_editor não trava célula por linha)
+                linhas = [{"ID": sep.id, "Código": d.item.codigo, "Descrição": d.item.descricao, "Meta": d.meta, "Total Sep.": d.tot_sep, "Rastreabilidade": sep.rastreabilidade,
+                           "Sep.": sep.qtd_separada, "Conf.": sep.qtd_conferida if sep.conferido else None, "Status Conf.": status_conferencia(sep), "Lançado": sep.enviado_sistema}
+                          for d in pagina for sep in d.separacoes]
+                sem_lote = [{"Código": d.item.codigo, "Descrição": d.item.descricao, "Meta": d.meta} for d in pagina if not d.separacoes]
+                if linhas:
+                    dg = pd.DataFrame(linhas)
+                    versao = st.session_state.get("grade_adm_v", 0)
+                    eg = st.data_editor(dg, hide_index=True, use_container_width=True, key=f"grade_adm_{ped.id}_{versao}", column_config={"ID": None},
+                                        disabled=ped.status == 'CONCLUIDO' or [c for c in dg.columns if c != "Lançado"])
+                    mudou = eg["Lançado"] != dg["Lançado"]
+                    if mudou.any():
+                        marcar_lancamentos_erp(s, dict(zip(eg.loc[mudou, "ID"].astype(int), eg.loc[mudou, "Lançado"].astype(bool))))
+                        st.session_state["grade_adm_v"] = versao + 1; st.rerun()
+                if sem_lote:
+                    st.caption(f"Sem lote separado ({len(sem_lote)}): nada a lançar no ERP")
+                    st.dataframe(pd.DataFrame(sem_lote), hide_index=True, use_container_width=True)
+                divergentes = [d.item for d in pagina if d.tot_sep != d.meta] if ped.status != 'CONCLUIDO' else []
+                if divergentes:
+                    with st.expander(f"✏️ Justificativas de divergência ({len(divergentes)})"):
+                        for it in divergentes: campo_justificativa(s, it, f"{it.codigo} {it.descricao}")
+            else:
+                for d in pagina:
+                    it, tot_sep, meta = d.item, d.tot_sep, d.meta
                 
-                if tot_sep == 0: style, icon = f"{it.codigo} {it.descricao}", "⬜"
-                elif tot_sep < meta: style, icon = f":orange[{it.codigo} {it.descricao}]", "⏳"
-                elif tot_sep == meta: style, icon = f":green[{it.codigo} {it.descricao}]", "✅"
-                else: style, icon = f":red[{it.codigo} {it.descricao}]", "🚫"
-
-                with st.expander(f"{icon} {style} ({tot_sep}/{meta})"):
-                     if (tot_sep != meta) and ped.status != 'CONCLUIDO':
-                         j = st.text_input("Justificativa", value=it.justificativa_divergencia or "", key=f"j_{it.id}")
-                         if j != it.justificativa_divergencia: it.justificativa_divergencia = j; s.commit()
+                    if tot_sep == 0: style, icon = f"{it.codigo} {it.descricao}", "⬜"
+                    elif tot_sep < meta: style, icon = f":orange[{it.codigo} {it.descricao}]", "⏳"
+                    elif tot_sep == meta: style, icon = f":green[{it.codigo} {it.descricao}]", "✅"
+                    else: style, icon = f":red[{it.codigo} {it.descricao}]", "🚫"
+
+                    with st.expander(f"{icon} {style} ({tot_sep}/{meta})"):
+                         if (tot_sep != meta) and ped.status != 'CONCLUIDO': campo_justificativa(s, it)
                      
-                     if not it.separacoes: st.caption("Nada separado.")
+                         if not d.separacoes: st.caption("Nada separado.")
                      
-                     # --- CABEÇALHO DA TABELA ADM ---
-                     cols_h = st.columns([3, 1, 1, 2, 2, 1])
-                     cols_h[0].markdown("**Rastreabilidade**")
-                     cols_h[1].markdown("**Sep.**")
-                     cols_h[2].markdown("**Conf.**") # Nova coluna para ADM ver
-                     cols_h[3].markdown("**Status Conf.**")
-                     cols_h[4].markdown("**ERP**")
-
-                     for sep in it.separacoes:
-                         c1, c2, c3, c4, c5, c6 = st.columns([3, 1, 1, 2, 2, 1])
-                         c1.text(sep.rastreabilidade)
-                         c2.text(sep.qtd_separada)
+                         # --- CABEÇALHO DA TABELA ADM ---
+                         cols_h = st.columns([3, 1, 1, 2, 2, 1])
+                         cols_h[0].markdown("**Rastreabilidade**")
+                         cols_h[1].markdown("**Sep.**")
+                         cols_h[2].markdown("**Conf.**") # Nova coluna para ADM ver
+                         cols_h[3].markdown("**Status Conf.**")
+                         cols_h[4].markdown("**ERP**")
+
+                         for sep in d.separacoes:
+                             c1, c2, c3, c4, c5, c6 = st.columns([3, 1, 1, 2, 2, 1])
+                             c1.text(sep.rastreabilidade)
+                             c2.text(sep.qtd_separada)
                          
-                         # --- COLUNA NOVA: MOSTRAR CONFERIDO ---
-                         # Se houver divergencia, pinta de vermelho
-                         val_conf = sep.qtd_conferida if sep.qtd_conferida is not None else 0.0
-                         if sep.conferido and (val_conf != sep.qtd_separada):
-                             c3.markdown(f":red[**{val_conf}**]") # Alerta visual
-                         else:
-                             c3.text(val_conf if sep.conferido else "-")
+                             # --- COLUNA NOVA: MOSTRAR CONFERIDO ---
+                             # Se houver divergencia, pinta de vermelho
+                             val_conf = sep.qtd_conferida if sep.qtd_conferida is not None else 0.0
+                             if sep.conferido and (val_conf != sep.qtd_separada):
+                                 c3.markdown(f":red[**{val_conf}**]") # Alerta visual
+                             else:
+                                 c3.text(val_conf if sep.conferido else "-")
                          
-                         if sep.motivo_rejeicao: c4.error("RECUSADO")
-                         elif sep.conferido: c4.success("CONFERIDO")
-                         elif sep.enviado_conferencia: c4.warning("NA CONFERÊNCIA")
-                         else: c4.caption("NA SEPARAÇÃO")
+                             if sep.motivo_rejeicao: c4.error("RECUSADO")
+                             elif sep.conferido: c4.success("CONFERIDO")
+                             elif sep.enviado_conferencia: c4.warning("NA CONFERÊNCIA")
+                             else: c4.caption("NA SEPARAÇÃO")
                          
-                         disable_erp = (ped.status == 'CONCLUIDO')
-                         is_chk = c5.checkbox("Lançado", value=sep.enviado_sistema, key=f"erp_{sep.id}", disabled=disable_erp)
-                         if is_chk != sep.enviado_sistema:
-                             sep.enviado_sistema = is_chk; sep.data_envio = datetime.now() if is_chk else None; s.commit(); st.rerun()
-                         
-                         if not sep.motivo_rejeicao and not sep.enviado_sistema: 
-                             pendencias_lancamento += 1
+                             disable_erp = (ped.status == 'CONCLUIDO')
+                             is_chk = c5.checkbox("Lançado", value=sep.enviado_sistema, key=f"erp_{sep.id}", disabled=disable_erp)
+                             if is_chk != sep.enviado_sistema:
+                                 marcar_lancamento_erp(s, sep, is_chk); st.rerun()
 
-                if tot_sep < meta: pendencias_separacao += 1
-            
             st.divider()
+            pendencias_lancamento, pendencias_separacao = det.pendencias_lancamento, det.pendencias_separacao
             
             if ped.status == 'CONCLUIDO':
                 st.success(f"Encerrado em {ped.data_conclusao}")
-                data_xls = []
-                for i in ped.itens:
-                    base = {"Cod": i.codigo, "Desc": i.descricao, "Meta": i.qtd_solicitada, "Justificativa": i.justificativa_divergencia}
-                    if not i.separacoes:
-                        base.update({"Qtd": 0, "Rastreabilidade": "-", "Conferido": "NAO"}); data_xls.append(base)
-                    for sp in i.separacoes:
-                        ln = base.copy(); ln.update({"Qtd": sp.qtd_separada, "Qtd Conferida": sp.qtd_conferida, "Rastreabilidade": sp.rastreabilidade, "Conferido": "SIM" if sp.conferido else "NAO", "ERP": "SIM" if sp.enviado_sistema else "NAO"}); data_xls.append(ln)
-                out = io.BytesIO()
-                with pd.ExcelWriter(out, engine='xlsxwriter') as w: pd.DataFrame(data_xls).to_excel(w, index=False)
-                st.download_button("⬇️ Excel Final", out, f"F_{ped.numero_pedido}.xlsx")
+                if st.button("📄 Gerar Excel Final"):
+                    submeter(s, "exportar_excel", parametros={"pedido_id": ped.id}, usuario_id=st.session_state['user'].id)
+                painel_tarefas(s, ["exportar_excel"], "exp")
             else:
                 st.markdown(f"**Status Atual:** {pendencias_lancamento} itens pendentes de lançamento no ERP. {pendencias_separacao} itens com saldo de separação.")
                 
@@ -372,10 +305,10 @@ def adm_screen():
                      st.error(f"🚫 Impossível arquivar: Existem {pendencias_lancamento} itens que ainda não foram lançados no sistema.")
                 else:
                     if st.button("✅ CONCLUIR PEDIDO (ARQUIVAR)", type="primary"):
-                        encerrar_cronometros_abertos(s, ped.id)
-                        ped.status = 'CONCLUIDO'; ped.data_conclusao = datetime.now(); s.commit(); st.balloons(); time.sleep(1); st.rerun()
+                        with medir("concluir_pedido"):
+                            concluir_pedido(s, ped); rerun_com_aviso(f"Pedido {ped.numero_pedido} concluído!", "✅", baloes=True)
 
-    with t4:
+    with t4, medir("aba:usuarios"):
         with st.form("nu"):
             c1, c2, c3, c4 = st.columns(4)
             nu = c1.text_input("User"); np = c2.text_input("Pass", type="password"); nr = c3.selectbox("Perfil", ["ADM", "SEPARADOR", "CONFERENTE", "AMBOS"])
@@ -385,6 +318,222 @@ def adm_screen():
         st.divider()
         for u in s.query(Usuario).all(): st.text(f"{u.username} - {u.perfil}")
 
+    with t5:
+        st.caption("Latência (ms) e consultas SQL por ação, tela e aba desde o início deste processo. Faixas: quantidade de execuções com duração até o limite.")
+        banco = resumo_banco()
+        c1, c2 = st.columns(2)
+        c1.metric("Consultas SQL (processo)", banco["consultas"]); c2.metric("Tempo em SQL", f"{banco['tempo_ms'] / 1000:.1f} s")
+        lat = resumo_latencias()
+        if not lat: st.info("Nenhuma ação medida ainda.")
+        else: st.dataframe(pd.DataFrame(lat), hide_index=True, use_container_width=True)
+        caches = estatisticas_caches()
+        if caches: st.dataframe(pd.DataFrame(caches), hide_index=True, use_container_width=True)
+        if escrita.ESCRITA_AGRUPADA:
+            e = escrita.estatisticas()
+            st.caption(f"Escrita agrupada: {e['eventos']} eventos em {e['lotes']} commits (média {e['media_lote']}, maior lote {e['maior_lote']}, {e['falhas']} lotes refeitos um a um).")
+        c1, c2 = st.columns(2)
+        c1.download_button("⬇️ Métricas (Prometheus)", exportar_prometheus(), "pmp_metricas.prom", "text/plain")
+        if c2.button("Zerar métricas"): zerar_latencias(); st.rerun()
+
+    with t6, medir("aba:exportacao_bi"):
+        st.caption("Pedidos, itens, lotes e eventos de tempo do período, um arquivo por tabela (zip). Para cargas incrementais agendadas use `python exportacao.py --incremental`.")
+        c1, c2, c3 = st.columns(3)
+        desde = c1.date_input("De", value=datetime.now().date() - timedelta(days=30), key="bi_desde")
+        ate = c2.date_input("Até", value=datetime.now().date(), key="bi_ate")
+        formato = c3.selectbox("Formato", ["parquet", "csv"], key="bi_formato")
+        if st.button("📤 Exportar"):
+            periodo = {"desde": datetime.combine(desde, datetime.min.time()).isoformat(), "ate": datetime.combine(ate, datetime.max.time()).isoformat()}
+            submeter(s, "exportar_bi", None, {**periodo, "formato": formato}, st.session_state['user'].id)
+            st.toast("Exportação enviada para processamento.", icon="📤")
+        painel_tarefas(s, ["exportar_bi"], "bi")
+
+def form_bipagem(s, u, itens, chave, use_camera):
+    """Formulário de bipagem; com mais de um item (modo grade) o item é escolhido numa lista."""
+    with st.form(key=f"add_sep_{chave}", clear_on_submit=True):
+        por_id = {i.id: i for i in itens}
+        it = itens[0] if len(itens) == 1 else por_id[st.selectbox("Item", list(por_id), format_func=lambda x: f"{por_id[x].codigo} {por_id[x].descricao}")]
+        if use_camera:
+            img = st.camera_input("Foto do Código", key=f"cam_{chave}")
+            decoded_text = ""
+            if img:
+                decoded_text = ler_codigo(img)
+                if decoded_text:
+                    st.success(f"Lido: {decoded_text}")
+                else:
+                    st.error("⚠️ Falha na leitura.")
+            
+            val_inicial = decoded_text if decoded_text else ""
+            nr = st.text_input("Rastreabilidade", value=val_inicial)
+        else:
+            nr = st.text_input("Rastreabilidade", placeholder="Bipe aqui...")
+
+        nq = st.number_input("Qtd", min_value=0.01, step=0.1)
+        
+        if st.form_submit_button("Salvar"):
+            if nr and nq:
+                with medir("salvar_bipagem"):
+                    fila_local.enfileirar(it.id, nr, nq, u.id)
+                    fila_local.sincronizar(s); st.rerun()
+            else:
+                st.warning("Preencha os dados.")
+
+def aba_separacao(s, u):
+    sincronizou = fila_local.sincronizar(s)
+    fila = fila_local.pendentes(u.id)
+    if not sincronizou: st.warning(f"📡 Sem conexão com o banco: {len(fila)} bipagens guardadas na fila local.")
+    peds_visiveis = pedidos_para_separacao(s)
+    sug = sugerir_pedido(s, u.id) if peds_visiveis else None
+    if sug and DISTRIBUICAO_MODO == "automatico":
+        # Só o pedido atribuído e os que ele ainda está rodando (para poder pausar)
+        peds_visiveis = [p for p in peds_visiveis if p.id == sug.pedido_id or p.id in sug.em_andamento]
+
+    if not peds_visiveis: st.info("Tudo em dia! Aguardando novos pedidos do ADM.")
+    else:
+        ids_visiveis = [p.id for p in peds_visiveis]
+        pid = st.selectbox("Selecione Pedido", ids_visiveis, index=ids_visiveis.index(sug.pedido_id) if sug and sug.pedido_id in ids_visiveis else 0,
+                           format_func=lambda x: next((f"{'⭐ ' if sug and sug.pedido_id == x else ''}{p.numero_pedido}" for p in peds_visiveis if p.id==x), x), key="sel_ped_sep")
+        det = carregar_detalhe_pedido(s, pid)
+        ped = det.pedido
+        # Último estado carregado: se o banco cair, a bipagem continua com estes itens
+        st.session_state['_sep_ultimo'] = {"numero": ped.numero_pedido, "itens": [(d.item.id, d.item.codigo, d.item.descricao, round(d.tot_sep, 2), round(d.meta, 2)) for d in det.itens]}
+        if sug and sug.pedido_id == pid:
+            codigos = {d.item.id: d.item.codigo for d in det.itens}
+            st.caption(f"⭐ Sugerido: {sug.motivo}." + (f" Comece pelos itens {', '.join(codigos[i] for i in sug.itens if i in codigos)}." if sug.itens else ""))
+                
+        meu_tempo = det.tempos.get(u.id, timedelta(0))
+        st.caption(f"Tempo acumulado: {formatar_delta(meu_tempo)}")
+                
+        log = ultimo_evento_tempo(s, ped.id, u.id)
+        working = (log and log.acao == "INICIO")
+                
+        c_btn, c_mode, _ = st.columns([1, 2, 2])
+        if not working:
+            if c_btn.button("▶️ INICIAR TRABALHO", type="primary"):
+                registrar_tempo(s, ped.id, u.id, "INICIO"); st.rerun()
+        else:
+            if c_btn.button("⏸️ PAUSAR"):
+                fila_local.sincronizar(s, forcar=True)
+                registrar_tempo(s, ped.id, u.id, "PAUSA"); st.rerun()
+                
+        use_camera = c_mode.toggle("📸 Câmera (Melhorado)")
+
+        st.divider()
+        # Totais de todos os itens (baratos); só a página atual é desenhada
+        fila_por_item = {}
+        for e in fila: fila_por_item.setdefault(e['item_id'], []).append(e)
+        linhas = []
+        for d in det.itens:
+            na_fila = fila_por_item.get(d.item.id, [])
+            done = round(d.tot_sep + sum(e['qtd'] for e in na_fila), 2)
+            rascunhos = sum(1 for x in d.separacoes if not x.enviado_conferencia) + len(na_fila)
+            linhas.append((d, na_fila, done, round(d.meta, 2), rascunhos))
+        pendencias_envio = sum(sum(1 for x in d.separacoes if not x.enviado_conferencia and not x.motivo_rejeicao) + len(nf) for d, nf, _, _, _ in linhas)
+
+        pagina, grade = paginar_itens(linhas, "pag_sep", pendente=lambda l: l[2] < l[3] or l[4] > 0, codigo=lambda l: l[0].item.codigo)
+        if grade:
+            # Uma tabela para a página inteira e um único formulário de bipagem
+            st.dataframe([{"Código": d.item.codigo, "Descrição": d.item.descricao, "Separado": done, "Meta": meta, "Rascunhos": rasc,
+                           "Situação": "⬜" if done == 0 else "⏳" if done < meta else "✅" if done == meta else "🚫"} for d, _, done, meta, rasc in pagina],
+                         hide_index=True, use_container_width=True)
+            # O que o modo lista deixa apagar: rascunhos, lotes recusados e bipagens na fila
+            apagaveis = [(d.item, sep) for d, _, _, _, _ in pagina for sep in d.separacoes if (not sep.enviado_conferencia) or (sep.motivo_rejeicao is not None)]
+            na_fila_pag = [(d.item, e) for d, na_fila, _, _, _ in pagina for e in na_fila]
+            if apagaveis or na_fila_pag:
+                with st.expander(f"🗑️ Rascunhos, recusados e fila ({len(apagaveis) + len(na_fila_pag)})", expanded=any(sep.motivo_rejeicao for _, sep in apagaveis)):
+                    for it, sep in apagaveis:
+                        c1, c2, c3 = st.columns([4, 2, 1])
+                        if sep.motivo_rejeicao: c1.error(f"{it.codigo} · {sep.rastreabilidade} ❌ RECUSADO: {sep.motivo_rejeicao}")
+                        else: c1.markdown(f"**{it.codigo} · {sep.rastreabilidade} (Rascunho)**")
+                        c2.text(sep.qtd_separada)
+                        if c3.button("🗑️", key=f"del_{sep.id}"):
+                            s.delete(sep); s.commit(); st.rerun()
+                    for it, e in na_fila_pag:
+                        c1, c2, c3 = st.columns([4, 2, 1])
+                        c1.markdown(f"**{it.codigo} · {e['rastreabilidade']} (Na fila 📡)**")
+                        c2.text(e['qtd'])
+                        if c3.button("🗑️", key=f"del_fila_{e['chave']}"):
+                            fila_local.remover(e['chave']); st.rerun()
+            if working:
+                abertos = [d.item for d, _, done, meta, _ in pagina if done < meta or meta == 0]
+                if abertos: form_bipagem(s, u, abertos, "sep_grade", use_camera)
+            else:
+                st.caption("Inicie o trabalho para adicionar.")
+                
+        for d, na_fila, done, meta, rascunhos in ([] if grade else pagina):
+            it = d.item
+            if done == 0: style, icon = f"{it.codigo} {it.descricao}", "⬜"
+            elif done < meta: style, icon = f":orange[{it.codigo} {it.descricao}]", "⏳"
+            elif done == meta: style, icon = f":green[{it.codigo} {it.descricao}]", "✅"
+            else: style, icon = f":red[{it.codigo} {it.descricao}]", "🚫"
+                    
+            open_exp = (done < meta) or (rascunhos > 0)
+                    
+            with st.expander(f"{icon} {style} ({done}/{meta})", expanded=open_exp):
+                for sep in d.separacoes:
+                    c1, c2, c3 = st.columns([4, 2, 1])
+                    lbl = sep.rastreabilidade
+                    if sep.motivo_rejeicao: 
+                        lbl += f" ❌ RECUSADO: {sep.motivo_rejeicao}"
+                        c1.error(lbl)
+                    elif sep.enviado_conferencia:
+                        lbl += " (Enviado)"
+                        c1.text(lbl)
+                    else:
+                        lbl += " (Rascunho)"
+                        c1.markdown(f"**{lbl}**")
+                    c2.text(sep.qtd_separada)
+                    pode_apagar = (not sep.enviado_conferencia) or (sep.motivo_rejeicao is not None)
+                    if pode_apagar:
+                        if c3.button("🗑️", key=f"del_{sep.id}"):
+                            s.delete(sep); s.commit(); st.rerun()
+
+                for e in na_fila:
+                    c1, c2, c3 = st.columns([4, 2, 1])
+                    c1.markdown(f"**{e['rastreabilidade']} (Na fila 📡)**")
+                    c2.text(e['qtd'])
+                    if c3.button("🗑️", key=f"del_fila_{e['chave']}"):
+                        fila_local.remover(e['chave']); st.rerun()
+
+                if working:
+                    if done < meta or meta == 0:
+                        st.markdown("---")
+                        form_bipagem(s, u, [it], str(it.id), use_camera)
+                else:
+                    st.caption("Inicie o trabalho para adicionar.")
+
+        st.divider()
+        if fila:
+            c_fila, c_sync = st.columns([3, 1])
+            c_fila.caption(f"📡 {len(fila)} bipagens na fila local (sincroniza a cada {fila_local.FILA_LOTE_MAX} ou {int(fila_local.FILA_ESPERA_MAX.total_seconds())}s).")
+            if c_sync.button("🔄 Sincronizar agora"):
+                if fila_local.sincronizar(s, forcar=True): st.rerun()
+                else: st.error("Falha ao sincronizar. As bipagens continuam na fila.")
+        if pendencias_envio > 0:
+            st.warning(f"Você tem {pendencias_envio} rastreabilidades prontas.")
+            if st.button("🚀 ENVIAR TUDO PARA CONFERÊNCIA", type="primary"):
+                with medir("enviar_conferencia"):
+                    if not fila_local.sincronizar(s, forcar=True): st.error("Falha ao sincronizar a fila. Tente novamente."); st.stop()
+                    enviar_para_conferencia(s, ped.id); rerun_com_aviso("Enviado!", "🚀")
+        else:
+            if working: st.info("Adicione itens para enviar.")
+
+def separacao_sem_banco(s, u, erro):
+    """Banco fora do ar: mostra o último pedido carregado e mantém a bipagem (vai para a fila local)."""
+    try: s.rollback()
+    except Exception: pass
+    print(f"Erro separação: {erro}")
+    fila = fila_local.pendentes(u.id)
+    st.warning(f"📡 Sem conexão com o banco: mostrando o último estado carregado. {len(fila)} bipagens na fila local, gravadas quando o banco voltar.")
+    ultimo = st.session_state.get('_sep_ultimo')
+    if not ultimo: st.info("Nenhum pedido carregado nesta sessão."); return
+    na_fila = {}
+    for e in fila: na_fila[e['item_id']] = na_fila.get(e['item_id'], 0) + e['qtd']
+    st.caption(f"Pedido {ultimo['numero']}")
+    st.dataframe([{"Código": cod, "Descrição": desc, "Separado": round(tot + na_fila.get(iid, 0), 2), "Meta": meta} for iid, cod, desc, tot, meta in ultimo['itens']],
+                 hide_index=True, use_container_width=True)
+    itens = [SimpleNamespace(id=iid, codigo=cod, descricao=desc) for iid, cod, desc, _, _ in ultimo['itens']]
+    if itens: form_bipagem(s, u, itens, "sep_sem_banco", use_camera=False)
+
 def op_screen():
     s = get_db()
     u = st.session_state['user']
@@ -399,138 +548,26 @@ def op_screen():
     
     # --- ABA SEPARAÇÃO ---
     if "📦 Separação" in tabs:
-        with ts[tabs.index("📦 Separação")]:
-            peds_all = s.query(Pedido).filter(Pedido.status == 'EM_ANDAMENTO').all()
-            peds_visiveis = []
-            for p in peds_all:
-                mostrar = False
-                for it in p.itens:
-                    tot = sum([x.qtd_separada for x in it.separacoes])
-                    if tot < it.qtd_solicitada: mostrar = True
-                    rascunhos = [x for x in it.separacoes if (not x.enviado_conferencia) or (x.motivo_rejeicao)]
-                    if rascunhos: mostrar = True
-                if mostrar: peds_visiveis.append(p)
-
-            if not peds_visiveis: st.info("Tudo em dia! Aguardando novos pedidos do ADM.")
-            else:
-                pid = st.selectbox("Selecione Pedido", [p.id for p in peds_visiveis], format_func=lambda x: next((f"{p.numero_pedido}" for p in peds_visiveis if p.id==x), x), key="sel_ped_sep")
-                ped = s.query(Pedido).get(pid)
-                
-                tempos, _ = calcular_tempos_reais(s, ped.id)
-                meu_tempo = tempos.get(u.id, timedelta(0))
-                st.caption(f"Tempo acumulado: {formatar_delta(meu_tempo)}")
-                
-                log = s.query(LogTempo).filter_by(pedido_id=ped.id, usuario_id=u.id).order_by(LogTempo.timestamp.desc()).first()
-                working = (log and log.acao == "INICIO")
-                
-                c_btn, c_mode, _ = st.columns([1, 2, 2])
-                if not working:
-                    if c_btn.button("▶️ INICIAR TRABALHO", type="primary"):
-                        s.add(LogTempo(pedido_id=ped.id, usuario_id=u.id, acao="INICIO")); s.commit(); st.rerun()
-                else:
-                    if c_btn.button("⏸️ PAUSAR"):
-                        s.add(LogTempo(pedido_id=ped.id, usuario_id=u.id, acao="PAUSA")); s.commit(); st.rerun()
-                
-                use_camera = c_mode.toggle("📸 Câmera (Melhorado)")
-
-                st.divider()
-                pendencias_envio = 0
-                
-                for it in ped.itens:
-                    done = round(sum([sep.qtd_separada for sep in it.separacoes]), 2)
-                    meta = round(it.qtd_solicitada, 2)
-                    meus_rascunhos = [x for x in it.separacoes if not x.enviado_conferencia]
-                    
-                    if done == 0: style, icon = f"{it.codigo} {it.descricao}", "⬜"
-                    elif done < meta: style, icon = f":orange[{it.codigo} {it.descricao}]", "⏳"
-                    elif done == meta: style, icon = f":green[{it.codigo} {it.descricao}]", "✅"
-                    else: style, icon = f":red[{it.codigo} {it.descricao}]", "🚫"
-                    
-                    open_exp = (done < meta) or (len(meus_rascunhos) > 0)
-                    
-                    with st.expander(f"{icon} {style} ({done}/{meta})", expanded=open_exp):
-                        for sep in it.separacoes:
-                            c1, c2, c3 = st.columns([4, 2, 1])
-                            lbl = sep.rastreabilidade
-                            if sep.motivo_rejeicao: 
-                                lbl += f" ❌ RECUSADO: {sep.motivo_rejeicao}"
-                                c1.error(lbl)
-                            elif sep.enviado_conferencia:
-                                lbl += " (Enviado)"
-                                c1.text(lbl)
-                            else:
-                                lbl += " (Rascunho)"
-                                c1.markdown(f"**{lbl}**")
-                            c2.text(sep.qtd_separada)
-                            pode_apagar = (not sep.enviado_conferencia) or (sep.motivo_rejeicao is not None)
-                            if pode_apagar:
-                                if c3.button("🗑️", key=f"del_{sep.id}"):
-                                    s.delete(sep); s.commit(); st.rerun()
-                            if not sep.enviado_conferencia and not sep.motivo_rejeicao:
-                                pendencias_envio += 1
-
-                        if working:
-                            if done < meta or meta == 0:
-                                st.markdown("---")
-                                with st.form(key=f"add_sep_{it.id}", clear_on_submit=True):
-                                    if use_camera:
-                                        img = st.camera_input("Foto do Código", key=f"cam_{it.id}")
-                                        decoded_text = ""
-                                        if img:
-                                            decoded_text = tentar_ler_codigo_robustamente(img)
-                                            if decoded_text:
-                                                st.success(f"Lido: {decoded_text}")
-                                            else:
-                                                st.error("⚠️ Falha na leitura.")
-                                        
-                                        val_inicial = decoded_text if decoded_text else ""
-                                        nr = st.text_input("Rastreabilidade", value=val_inicial)
-                                    else:
-                                        nr = st.text_input("Rastreabilidade", placeholder="Bipe aqui...")
-
-                                    nq = st.number_input("Qtd", min_value=0.01, step=0.1)
-                                    
-                                    if st.form_submit_button("Salvar"):
-                                        if nr and nq:
-                                            s.add(Separacao(item_id=it.id, rastreabilidade=nr, qtd_separada=nq, separador_id=u.id, enviado_conferencia=False))
-                                            s.commit(); st.rerun()
-                                        else:
-                                            st.warning("Preencha os dados.")
-                        else:
-                            st.caption("Inicie o trabalho para adicionar.")
-
-                st.divider()
-                if pendencias_envio > 0:
-                    st.warning(f"Você tem {pendencias_envio} rastreabilidades prontas.")
-                    if st.button("🚀 ENVIAR TUDO PARA CONFERÊNCIA", type="primary"):
-                        rascunhos = s.query(Separacao).join(ItemPedido).filter(ItemPedido.pedido_id == ped.id, Separacao.enviado_conferencia == False).all()
-                        for r in rascunhos: r.enviado_conferencia = True
-                        s.commit(); st.success("Enviado!"); time.sleep(1); st.rerun()
-                else:
-                    if working: st.info("Adicione itens para enviar.")
+        with ts[tabs.index("📦 Separação")], medir("aba:separacao"):
+            try: aba_separacao(s, u)
+            except SQLAlchemyError as e: separacao_sem_banco(s, u, e)
 
     # --- ABA CONFERÊNCIA (LÓGICA NOVA DE CONTAGEM) ---
     if "📋 Conferência" in tabs:
-        with ts[tabs.index("📋 Conferência")]:
-            peds_conf = []
-            raw_peds = s.query(Pedido).filter(Pedido.status == 'EM_ANDAMENTO').all()
-            for p in raw_peds:
-                tem = False
-                for it in p.itens:
-                    # Pendente se: enviado pra conf E não conferido E não rejeitado
-                    pendentes = [x for x in it.separacoes if x.enviado_conferencia and not x.conferido and not x.motivo_rejeicao]
-                    if pendentes: tem = True; break
-                if tem: peds_conf.append(p)
+        with ts[tabs.index("📋 Conferência")], medir("aba:conferencia"):
+            peds_conf = pedidos_para_conferencia(s)
             
             if not peds_conf: st.info("Nada para conferir.")
             else:
                 pid = st.selectbox("Selecione Pedido", [p.id for p in peds_conf], format_func=lambda x: next((f"{p.numero_pedido}" for p in peds_conf if p.id==x), x), key="sel_ped_conf")
-                ped = s.query(Pedido).get(pid)
+                det = carregar_detalhe_pedido(s, pid)
                 st.divider()
                 st.markdown("### Itens aguardando sua contagem")
-                count_pend = 0
-                for it in ped.itens:
-                    to_check = [x for x in it.separacoes if x.enviado_conferencia and not x.conferido and not x.motivo_rejeicao]
+                a_conferir = [(d.item, [x for x in d.separacoes if aguardando_conferencia(x)]) for d in det.itens]
+                a_conferir = [(it, lotes) for it, lotes in a_conferir if lotes]
+                count_pend = sum(len(lotes) for _, lotes in a_conferir)
+                pagina, _ = paginar_itens(a_conferir, "pag_conf", pendente=None, codigo=lambda l: l[0].codigo, com_grade=False)
+                for it, to_check in pagina:
                     if to_check:
                         with st.expander(f"{it.codigo} {it.descricao} ({len(to_check)} lotes)", expanded=True):
                             # Cabeçalho da tabela de conferência
@@ -552,45 +589,41 @@ def op_screen():
                                 # Botão de Ação
                                 if c4.button("Conferir", key=f"btn_check_{sep.id}"):
                                     if val_contada == sep.qtd_separada:
-                                        # Caso ideal: Bateu!
-                                        sep.qtd_conferida = val_contada
-                                        sep.conferido = True
-                                        sep.data_conferencia = datetime.now()
-                                        s.commit()
-                                        st.toast("✅ Contagem Correta! Aprovado.")
-                                        time.sleep(0.5)
-                                        st.rerun()
+                                        with medir("conferir_aprovar"):
+                                            # Caso ideal: Bateu!
+                                            aprovar_conferencia(s, sep, val_contada)
+                                            rerun_com_aviso("Contagem Correta! Aprovado.")
                                     else:
-                                        # Divergência: Salva no estado para mostrar alerta
-                                        st.session_state[f"alert_div_{sep.id}"] = True
+                                        # Divergência: grava a contagem no lote para mostrar alerta (em qualquer réplica)
+                                        registrar_divergencia(s, sep, val_contada)
                                 
-                                # Se houver alerta de divergência no estado
-                                if st.session_state.get(f"alert_div_{sep.id}"):
-                                    st.warning(f"⚠️ DIVERGÊNCIA! Separado: {sep.qtd_separada} | Contado: {val_contada}")
+                                # Se houver divergência pendente no lote
+                                if sep.contagem_divergente is not None:
+                                    st.warning(f"⚠️ DIVERGÊNCIA! Separado: {sep.qtd_separada} | Contado: {sep.contagem_divergente}")
                                     cola, colb = st.columns(2)
                                     if cola.button("Aceitar Divergência", key=f"accept_{sep.id}"):
-                                        sep.qtd_conferida = val_contada
-                                        sep.conferido = True
-                                        sep.data_conferencia = datetime.now()
-                                        del st.session_state[f"alert_div_{sep.id}"] # Limpa alerta
-                                        s.commit()
+                                        aprovar_conferencia(s, sep, sep.contagem_divergente)
                                         st.rerun()
                                     
                                     if colb.button("Recusar/Devolver", key=f"reject_{sep.id}"):
-                                        sep.motivo_rejeicao = f"Divergência de Qtd (Sep: {sep.qtd_separada} vs Conf: {val_contada})"
-                                        sep.enviado_conferencia = False
-                                        sep.conferido = False
-                                        del st.session_state[f"alert_div_{sep.id}"] # Limpa alerta
-                                        s.commit()
+                                        recusar_conferencia(s, sep, sep.contagem_divergente)
                                         st.rerun()
 
-                                count_pend += 1
                 if count_pend == 0: st.success("Tudo conferido!")
 
 # --- MAIN ---
-init_users()
-if 'user' not in st.session_state: login_screen()
-else:
-    st.sidebar.button("Sair", on_click=lambda: st.session_state.pop('user'))
-    if st.session_state['user'].perfil == 'ADM': adm_screen()
-    else: op_screen()
+# Cada execução do script (rerun) é medida por tela: consultas por rerun denunciam N+1.
+try:
+    init_users()
+    restaurar_login()
+    mostrar_aviso_pendente()
+    if 'user' not in st.session_state:
+        with medir("tela:login"): login_screen()
+    else:
+        st.sidebar.button("Sair", on_click=sair)
+        if st.session_state['user'].perfil == 'ADM':
+            with medir("tela:adm"): adm_screen()
+        else:
+            with medir("tela:operacao"): op_screen()
+finally:
+    gravar_arquivo_prometheus()
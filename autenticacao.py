@@ -0,0 +1,44 @@
+# --- AUTENTICAÇÃO POR TOKEN ASSINADO ---
+# O login não depende do st.session_state de uma réplica: o token (HMAC-SHA256)
+# vai na URL (?t=...) e qualquer réplica reconstrói o usuário a partir dele
+# quando o navegador reconecta (F5, queda de réplica, balanceador sem afinidade).
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+from modelos import Usuario
+
+# Deve ser o mesmo em todas as réplicas. Sem PMP_SEGREDO, os tokens valem só para este processo,
+# o que só serve com uma réplica: com PMP_EXIGIR_SEGREDO=1 (perfil replicas) a falta dele é erro.
+if os.getenv("PMP_EXIGIR_SEGREDO") == "1" and not os.getenv("PMP_SEGREDO"):
+    raise RuntimeError("PMP_SEGREDO não definido: obrigatório com várias réplicas (PMP_EXIGIR_SEGREDO=1)")
+SEGREDO = (os.getenv("PMP_SEGREDO") or secrets.token_hex(32)).encode()
+VALIDADE_S = int(float(os.getenv("PMP_TOKEN_HORAS", 12)) * 3600)
+
+def _assinar(corpo, senha):
+    # A senha entra na assinatura: trocar/resetar a senha invalida os tokens já emitidos
+    d = hmac.new(SEGREDO, f"{corpo}|{senha or ''}".encode(), hashlib.sha256).digest()[:24]
+    return base64.urlsafe_b64encode(d).decode()
+
+def emitir_token(usuario, agora=None):
+    corpo = f"{usuario.id}.{usuario.perfil}.{usuario.versao_token or 0}.{int((agora or time.time()) + VALIDADE_S)}"
+    return f"{corpo}.{_assinar(corpo, usuario.senha)}"
+
+def revogar_tokens(session, usuario):
+    """Invalida todos os tokens já emitidos para o usuário (o da URL pode ter ficado no histórico ou em logs)."""
+    usuario.versao_token = (usuario.versao_token or 0) + 1
+    session.commit()
+
+def usuario_do_token(session, token, agora=None):
+    """Usuário do token se a assinatura confere, não venceu, não foi revogado e o perfil não mudou; senão None."""
+    try:
+        uid, perfil, versao, expira, assinatura = token.split(".")
+        uid, versao, expira = int(uid), int(versao), int(expira)
+    except (AttributeError, ValueError): return None
+    if expira < (agora or time.time()): return None
+    u = session.get(Usuario, uid)
+    if not u or u.perfil != perfil or versao != (u.versao_token or 0): return None
+    if not hmac.compare_digest(assinatura, _assinar(f"{uid}.{perfil}.{versao}.{expira}", u.senha)): return None
+    return u
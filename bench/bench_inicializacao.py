@@ -0,0 +1,85 @@
+"""Benchmark de inicialização a frio: tempo e memória residente (RSS) por processo.
+
+Cada medição roda num processo Python novo, que renderiza o app com o AppTest do
+Streamlit (login, tela do operador ou painel ADM) contra um SQLite temporário.
+O modo "antecipado" importa antes cv2/numpy/zxingcpp/PIL/pandas, reproduzindo o
+app antigo que carregava tudo no topo do app.py; o modo "sob_demanda" é o app atual.
+
+Uso:
+    python bench/bench_inicializacao.py
+    python bench/bench_inicializacao.py --repeticoes 5 --json inicializacao.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(RAIZ, "app.py")
+PESADOS = ["cv2", "numpy", "zxingcpp", "PIL.Image", "pandas"]
+CENARIOS = ["login", "operador", "adm"]
+MODOS = ["antecipado", "sob_demanda"]
+
+# Executado no processo filho: imprime um JSON com as medições.
+FILHO = r'''
+import json, os, sys, time, resource, importlib
+t0 = time.perf_counter()
+cenario, modo, raiz, app, pesados = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5].split(",")
+sys.path.insert(0, raiz)
+if modo == "antecipado":
+    for m in pesados: importlib.import_module(m)
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(app, default_timeout=120).run()
+if cenario != "login":
+    from modelos import Session, Usuario
+    s = Session()
+    perfil = "ADM" if cenario == "adm" else "SEPARADOR"
+    if not s.query(Usuario).filter_by(username="bench_" + cenario).first():
+        s.add(Usuario(username="bench_" + cenario, senha="bench", perfil=perfil)); s.commit()
+    at.text_input[0].input("bench_" + cenario); at.text_input[1].input("bench"); at.button[0].click().run()
+erro = [str(e.value) for e in at.exception]
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"segundos": time.perf_counter() - t0, "rss_mb": rss_kb / 1024.0,
+                  "carregados": [m for m in pesados if m.split(".")[0] in sys.modules], "erro": erro}))
+'''
+
+def medir(cenario, modo, banco):
+    env = dict(os.environ, DATABASE_URL=banco)
+    saida = subprocess.run([sys.executable, "-c", FILHO, cenario, modo, RAIZ, APP, ",".join(PESADOS)],
+                           capture_output=True, text=True, env=env, cwd=RAIZ)
+    for linha in reversed(saida.stdout.splitlines()):
+        if linha.startswith("{"): return json.loads(linha)
+    raise RuntimeError(f"{cenario}/{modo} falhou:\n{saida.stderr[-2000:]}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--json", help="grava o resultado neste arquivo")
+    args = ap.parse_args()
+
+    banco = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="pmp_inic_"), "inic.db")
+    medir("login", "sob_demanda", banco)  # cria as tabelas e aquece o cache de disco fora da medição
+    resultados = []
+    for cenario in CENARIOS:
+        for modo in MODOS:
+            amostras = [medir(cenario, modo, banco) for _ in range(args.repeticoes)]
+            erros = sorted({e for a in amostras for e in a["erro"]})
+            resultados.append({"cenario": cenario, "modo": modo,
+                               "segundos": round(sorted(a["segundos"] for a in amostras)[len(amostras) // 2], 3),
+                               "rss_mb": round(max(a["rss_mb"] for a in amostras), 1),
+                               "carregados": ",".join(amostras[-1]["carregados"]) or "-", "erros": erros})
+
+    print(f"{'cenário':<10}{'modo':<13}{'tempo (s)':>10}{'RSS (MB)':>10}  módulos pesados carregados")
+    for r in resultados:
+        print(f"{r['cenario']:<10}{r['modo']:<13}{r['segundos']:>10}{r['rss_mb']:>10}  {r['carregados']}")
+        for e in r["erros"]: print(f"    erro: {e}")
+    for cenario in CENARIOS:
+        antes, depois = [r for r in resultados if r["cenario"] == cenario]
+        print(f"{cenario}: {antes['segundos'] - depois['segundos']:+.2f}s e {antes['rss_mb'] - depois['rss_mb']:+.1f} MB economizados")
+    if args.json:
+        with open(args.json, "w") as f: json.dump({"repeticoes": args.repeticoes, "resultados": resultados}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
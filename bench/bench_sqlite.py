@@ -0,0 +1,103 @@
+"""Benchmark de concorrência no SQLite: bipagens sustentadas com operadores simultâneos.
+
+Compara, cada um num processo novo e num banco novo, o SQLite como vinha
+(journal padrão, sem fila: SQLITE_CONCORRENCIA=0) com o modo de concorrência de
+modelos.py (WAL, busy_timeout, synchronous=NORMAL e fila única de escrita).
+Separadores gravam uma bipagem por clique (como nas réplicas, FILA_LOTE_MAX=1),
+registram INICIO/PAUSA e releem a tela do pedido; conferentes aprovam lotes.
+
+Uso:
+    python bench/bench_sqlite.py
+    python bench/bench_sqlite.py --operadores 10 --duracao 30 --json sqlite.json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from comum import Coletor, rodar_filho, repassar, gravar_json
+
+MODOS = {"padrao": {"SQLITE_CONCORRENCIA": "0"}, "wal_fila": {"SQLITE_CONCORRENCIA": "1"}}
+
+# --- PROCESSO FILHO: um modo, um banco ---
+def filho(args):
+    from modelos import engine, Session, Usuario, Pedido, ItemPedido, Separacao
+    from servicos import gravar_bipagens_em_lote, registrar_tempo, carregar_detalhe_pedido, aprovar_conferencia, enviar_para_conferencia
+    with engine.connect() as c: journal = c.exec_driver_sql("PRAGMA journal_mode").scalar()
+
+    s = Session()
+    conferentes = max(1, args.operadores // 5)
+    usuarios = [Usuario(username=f"sq_{k}", senha="x", perfil="CONFERENTE" if k < conferentes else "SEPARADOR") for k in range(args.operadores)]
+    s.add_all(usuarios)
+    ped = Pedido(numero_pedido="SQ1", data_pedido=f"{datetime.now():%d/%m/%Y}", status="EM_ANDAMENTO"); s.add(ped); s.flush()
+    itens = [ItemPedido(pedido_id=ped.id, codigo=str(100000 + i), descricao=f"MATERIAL {i}", unidade="UN", qtd_solicitada=10**6) for i in range(args.itens)]
+    s.add_all(itens); s.commit()
+    ids_itens, pid, ops = [i.id for i in itens], ped.id, [(u.id, u.perfil) for u in usuarios]
+    s.close()
+
+    c = Coletor()
+    fim = time.monotonic() + args.duracao
+
+
+    def separador(uid, seed):
+        rnd, sess, n = random.Random(seed), Session(), 0
+        try:
+            while time.monotonic() < fim:
+                if n % 20 == 0: c.medir("iniciar_pausar", sess, registrar_tempo, sess, pid, uid, "INICIO" if n % 40 == 0 else "PAUSA")
+                entrada = {"chave": uuid.uuid4().hex, "item_id": rnd.choice(ids_itens), "rastreabilidade": f"LT{rnd.randint(0, 10**9):09d}",
+                           "qtd": 1.0, "separador_id": uid, "registrado_em": datetime.now()}
+                c.medir("bipar", sess, gravar_bipagens_em_lote, sess, [entrada])
+                n += 1
+                if n % 10 == 0: c.medir("enviar", sess, enviar_para_conferencia, sess, pid)
+                if n % 25 == 0: c.medir("ler_tela", sess, carregar_detalhe_pedido, sess, pid)
+        finally: sess.close()
+
+    def conferente(uid, seed):
+        sess = Session()
+        try:
+            while time.monotonic() < fim:
+                lotes = (sess.query(Separacao).filter(Separacao.enviado_conferencia == True, Separacao.conferido == False).limit(5).all())
+                if not lotes: time.sleep(0.01)
+                for sep in lotes: c.medir("conferir", sess, aprovar_conferencia, sess, sep, sep.qtd_separada)
+        finally: sess.close()
+
+    threads = [threading.Thread(target=conferente if perfil == "CONFERENTE" else separador, args=(uid, args.seed + uid), daemon=True) for uid, perfil in ops]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    duracao = time.perf_counter() - t0
+
+    s = Session(); gravadas = s.query(Separacao).count(); s.close()
+    print(json.dumps({"journal": journal, "duracao": round(duracao, 2), "bipagens_gravadas": gravadas, "bipagens_s": round(gravadas / duracao, 1),
+                      "acoes": c.resumo(duracao), "exemplo_erro": c.exemplo_erro}))
+
+# --- PROCESSO PAI ---
+def rodar(modo, args):
+    banco = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix=f"pmp_sqlite_{modo}_"), "bench.db")
+    return rodar_filho(__file__, modo, dict(MODOS[modo], DATABASE_URL=banco), repassar(args, "operadores", "itens", "duracao", "seed"))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--operadores", type=int, default=10, help="separadores + conferentes (1 conferente a cada 5)")
+    ap.add_argument("--itens", type=int, default=200, help="itens do pedido")
+    ap.add_argument("--duracao", type=float, default=20.0, help="segundos de carga por modo")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="grava o resultado neste arquivo")
+    ap.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.filho: return filho(args)
+
+    resultados = {modo: rodar(modo, args) for modo in MODOS}
+    for modo, r in resultados.items():
+        print(f"\n[{modo}] journal={r['journal']} · {r['bipagens_gravadas']} bipagens em {r['duracao']}s = {r['bipagens_s']}/s")
+        print(f"{'ação':<16}{'n':>7}{'erros':>7}{'ops/s':>8}{'p50':>8}{'p99':>9}{'máx':>9}")
+        for l in r["acoes"]: print(f"{l['acao']:<16}{l['n']:>7}{l['erros']:>7}{l['ops_s']:>8}{l['p50_ms']:>8}{l['p99_ms']:>9}{l['max_ms']:>9}")
+        for nome, msg in r["exemplo_erro"].items(): print(f"  erro em {nome}: {msg}")
+    if args.json: gravar_json(args.json, args, modos=resultados)
+
+if __name__ == "__main__":
+    main()
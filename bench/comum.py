@@ -0,0 +1,74 @@
+"""Peças comuns dos benchmarks: coleta de latência por ação e execução de um modo num processo filho.
+
+O percentil é o de metricas.py (o mesmo da simulação da distribuição).
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from metricas import percentil, consultas_thread  # não abre o banco: o DATABASE_URL do filho/benchmark ainda vale
+
+# --- COLETA DE AMOSTRAS ---
+class Coletor:
+    """Latência (ms) e consultas SQL por ação; erros contados, com o primeiro exemplo de cada ação."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.amostras = defaultdict(list)   # ação -> [(ms, consultas)]
+        self.erros = defaultdict(int)
+        self.exemplo_erro = {}
+
+    def registrar(self, nome, ms, consultas=0):
+        with self.lock: self.amostras[nome].append((ms, consultas))
+
+    def falhou(self, nome, e):
+        with self.lock: self.erros[nome] += 1; self.exemplo_erro.setdefault(nome, str(e).splitlines()[0][:120])
+
+    def medir(self, nome, session, fn, *args, **kwargs):
+        """Chama `fn` e registra a latência; se falhar, desfaz a transação de `session`, conta o erro e devolve None."""
+        t0, q0 = time.perf_counter(), consultas_thread()
+        try: resultado = fn(*args, **kwargs)
+        except Exception as e:
+            session.rollback(); self.falhou(nome, e)
+            return None
+        self.registrar(nome, (time.perf_counter() - t0) * 1000.0, consultas_thread() - q0)
+        return resultado
+
+    def todas(self):
+        with self.lock: return [ms for v in self.amostras.values() for ms, _ in v]
+
+    def resumo(self, duracao, casas=1):
+        """Uma linha por ação: n, erros, ops/s, p50/p95/p99/máx (ms) e consultas por chamada."""
+        linhas = []
+        with self.lock: nomes = sorted(set(self.amostras) | set(self.erros))
+        for nome in nomes:
+            ms = [a[0] for a in self.amostras[nome]]; qs = [a[1] for a in self.amostras[nome]]
+            linhas.append({"acao": nome, "n": len(ms), "erros": self.erros.get(nome, 0), "ops_s": round(len(ms) / duracao, casas),
+                           "p50_ms": round(percentil(ms, 50), casas), "p95_ms": round(percentil(ms, 95), casas), "p99_ms": round(percentil(ms, 99), casas),
+                           "max_ms": round(max(ms), casas) if ms else 0.0, "consultas_media": round(sum(qs) / len(qs), 1) if qs else 0.0,
+                           "consultas_max": max(qs) if qs else 0})
+        return linhas
+
+# --- PROCESSO FILHO ---
+def repassar(args, *nomes):
+    """Argumentos de linha de comando para o filho, com os valores de `args` (ex.: "pausa_ms" -> --pausa-ms)."""
+    return [x for n in nomes for x in (f"--{n.replace('_', '-')}", str(getattr(args, n)))]
+
+def rodar_filho(script, modo, env, argumentos):
+    """Roda `script --filho ...` num processo novo com `env` somado ao ambiente e devolve o JSON da última linha."""
+    cmd = [sys.executable, os.path.abspath(script), "--filho", *argumentos]
+    saida = subprocess.run(cmd, capture_output=True, text=True, env=dict(os.environ, **env), cwd=RAIZ)
+    for linha in reversed(saida.stdout.splitlines()):
+        if linha.startswith("{"): return json.loads(linha)
+    raise RuntimeError(f"{modo} falhou:\n{saida.stderr[-2000:]}")
+
+def gravar_json(caminho, args, **dados):
+    """Grava o resultado com os parâmetros da execução (comparação entre execuções)."""
+    with open(caminho, "w") as f:
+        json.dump({"parametros": {k: v for k, v in vars(args).items() if k not in ("json", "filho")}, **dados}, f, indent=2, default=str)
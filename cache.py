@@ -0,0 +1,158 @@
+# --- CACHE LRU EM MEMÓRIA, LIMITADO POR BYTES ---
+# Instâncias ficam em módulos importados: sobrevivem aos reruns e são
+# compartilhadas por todas as sessões do processo.
+import os
+import sys
+import gzip
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+
+_AUSENTE = object()
+_caches = {}
+
+def _tamanho_padrao(chave, valor):
+    return sys.getsizeof(chave) + sys.getsizeof(valor)
+
+class CacheLRU:
+    def __init__(self, nome, max_bytes, tamanho=_tamanho_padrao):
+        self.nome = nome
+        self.max_bytes = max_bytes
+        self.tamanho = tamanho
+        self._dados = OrderedDict()     # chave -> (valor, bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.acertos = self.faltas = self.despejos = 0
+        _caches[nome] = self
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            item = self._dados.get(chave, _AUSENTE)
+            if item is _AUSENTE:
+                self.faltas += 1
+                return padrao
+            self._dados.move_to_end(chave)
+            self.acertos += 1
+            return item[0]
+
+    def guardar(self, chave, valor):
+        n = self.tamanho(chave, valor)
+        if n > self.max_bytes: return
+        with self._lock:
+            antigo = self._dados.pop(chave, None)
+            if antigo: self.bytes -= antigo[1]
+            self._dados[chave] = (valor, n)
+            self.bytes += n
+            while self.bytes > self.max_bytes:
+                _, (_, m) = self._dados.popitem(last=False)
+                self.bytes -= m; self.despejos += 1
+
+    def obter_ou_calcular(self, chave, calcular):
+        """Devolve o valor em cache ou calcula, guarda e devolve (None também é guardado)."""
+        valor = self.obter(chave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = calcular()
+            self.guardar(chave, valor)
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear(); self.bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {"Cache": self.nome, "Itens": len(self._dados), "Bytes": self.bytes, "Limite (bytes)": self.max_bytes,
+                    "Acertos": self.acertos, "Faltas": self.faltas, "Despejos": self.despejos,
+                    "Taxa de acerto": round(self.acertos / consultas, 3) if consultas else 0.0}
+
+# --- CACHE EM DISCO (JSON + gzip), LIMITADO POR BYTES ---
+# Um arquivo por chave: compartilhado entre processos (pool de tarefas, réplicas
+# no mesmo host) e preservado entre reinícios. Despejo pelo acesso mais antigo (mtime).
+class CacheDisco:
+    def __init__(self, nome, diretorio, max_bytes):
+        self.nome = nome
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.acertos = self.faltas = self.despejos = 0
+        _caches[nome] = self
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.json.gz")
+
+    def _arquivos(self):
+        """[(mtime, bytes, caminho)] dos arquivos do cache (outro processo pode removê-los a qualquer momento)."""
+        arquivos = []
+        try: entradas = list(os.scandir(self.diretorio))
+        except FileNotFoundError: return arquivos
+        for e in entradas:
+            if not e.name.endswith(".json.gz"): continue
+            try: st = e.stat()
+            except FileNotFoundError: continue
+            arquivos.append((st.st_mtime, st.st_size, e.path))
+        return arquivos
+
+    def obter(self, chave, padrao=None):
+        caminho = self._caminho(chave)
+        try:
+            with gzip.open(caminho, "rt", encoding="utf-8") as f: valor = json.load(f)
+            os.utime(caminho)  # marca o acesso para o despejo
+        except (OSError, ValueError):
+            with self._lock: self.faltas += 1
+            return padrao
+        with self._lock: self.acertos += 1
+        return valor
+
+    def guardar(self, chave, valor):
+        caminho = self._caminho(chave)
+        tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f: json.dump(valor, f, separators=(",", ":"))
+            if os.path.getsize(tmp) > self.max_bytes: os.remove(tmp); return
+            os.replace(tmp, caminho)  # atômico: leitores nunca veem arquivo pela metade
+        except OSError as e: print(f"Erro cache {self.nome}: {e}"); return
+        arquivos = sorted(self._arquivos())
+        total = sum(n for _, n, _ in arquivos)
+        for _, n, antigo in arquivos:
+            if total <= self.max_bytes: break
+            try: os.remove(antigo)
+            except OSError: pass
+            total -= n
+            with self._lock: self.despejos += 1
+
+    def obter_ou_calcular(self, chave, calcular):
+        valor = self.obter(chave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = calcular()
+            self.guardar(chave, valor)
+        return valor
+
+    def limpar(self):
+        for _, _, caminho in self._arquivos():
+            try: os.remove(caminho)
+            except OSError: pass
+
+    def estatisticas(self):
+        arquivos = self._arquivos()
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {"Cache": self.nome, "Itens": len(arquivos), "Bytes": sum(n for _, n, _ in arquivos), "Limite (bytes)": self.max_bytes,
+                    "Acertos": self.acertos, "Faltas": self.faltas, "Despejos": self.despejos,
+                    "Taxa de acerto": round(self.acertos / consultas, 3) if consultas else 0.0}
+
+def estatisticas_caches():
+    return [c.estatisticas() for c in list(_caches.values())]
+
+# --- LOJA CONFIGURÁVEL ---
+# "memoria": LRU por processo (padrão). "disco": diretório compartilhado entre processos
+# e réplicas do mesmo host/volume. Os caches do app são chaveados pelo hash do conteúdo
+# (imutáveis), então não há invalidação a propagar entre réplicas.
+CACHE_LOJA = os.getenv("CACHE_LOJA", "memoria")
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "pmp_cache"))
+
+def criar_cache(nome, max_bytes):
+    if CACHE_LOJA == "disco": return CacheDisco(nome, os.path.join(CACHE_DIR, nome), max_bytes)
+    return CacheLRU(nome, max_bytes)
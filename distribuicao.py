@@ -0,0 +1,249 @@
+# --- DISTRIBUIÇÃO DO TRABALHO ENTRE SEPARADORES ---
+# Sugere (ou atribui, com DISTRIBUICAO_MODO=automatico) o próximo pedido de cada separador a partir de:
+#   * itens em aberto por pedido (consulta agregada);
+#   * quem está RODANDO em cada pedido agora (último evento de LogTempo, como em calcular_tempos_reais);
+#   * itens/hora de cada operador no histórico recente.
+# Regra: cada pedido recebe no máximo min(itens abertos, EQUIPE_MAX) pessoas, para não amontoar gente
+# num pedido só. Entre os que ainda têm vaga, o operador vai para o que termina primeiro com ele
+# (itens abertos / itens por hora da equipe + dele); pedido sem ninguém há mais de ESPERA_MAX passa na frente.
+# Simulação sobre o histórico (mesma regra, mesmos operadores e horários registrados):
+#     python distribuicao.py --desde 2025-01-01 --ate 2025-07-01
+import os
+import math
+import time
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from modelos import Session, Usuario, Pedido, Separacao, LogTempo
+from servicos import itens_abertos
+from metricas import cronometrado, percentil
+from cache import CacheLRU
+
+DISTRIBUICAO_MODO = os.getenv("DISTRIBUICAO_MODO", "sugerir")   # sugerir | automatico
+EQUIPE_MAX = int(os.getenv("DISTRIBUICAO_EQUIPE_MAX", 3))
+ESPERA_MAX = timedelta(hours=float(os.getenv("DISTRIBUICAO_ESPERA_MAX_H", 4)))
+JANELA_HISTORICO = timedelta(days=int(os.getenv("DISTRIBUICAO_JANELA_DIAS", 30)))
+TAXA_PADRAO = 30.0      # itens/h quando ainda não há histórico nenhum
+HORAS_PRIOR = 2.0       # operador novo começa na média da equipe e converge para a própria taxa (a equipe, em TAXA_PADRAO)
+TAXA_MAX = float(os.getenv("DISTRIBUICAO_TAXA_MAX", 300))  # itens/h acima disso é erro de registro (INICIO/PAUSA em segundos), não ritmo
+LOTE_ITENS = 5          # itens sugeridos por vez
+PRESENCA = timedelta(hours=float(os.getenv("DISTRIBUICAO_PRESENCA_H", 10)))  # separador com evento neste intervalo está no turno
+
+# Produtividade muda devagar: recalculada a cada 5 min por processo, não a cada rerun
+_produtividade = CacheLRU("produtividade", 1_000_000)
+
+# --- HISTÓRICO ---
+def _eventos(session, desde, ate):
+    return (session.query(LogTempo.usuario_id, LogTempo.pedido_id, LogTempo.acao, LogTempo.timestamp)
+            .filter(LogTempo.timestamp >= desde, LogTempo.timestamp <= ate).order_by(LogTempo.timestamp, LogTempo.id).all())
+
+def intervalos_trabalho(eventos, ate):
+    """(usuario_id, pedido_id, inicio, fim) de cada INICIO → PAUSA/FIM; intervalo ainda aberto vai até `ate`."""
+    abertos = {}
+    for uid, pid, acao, ts in eventos:
+        if acao == "INICIO": abertos[(uid, pid)] = ts
+        elif (uid, pid) in abertos: yield uid, pid, abertos.pop((uid, pid)), ts
+    for (uid, pid), ts in abertos.items(): yield uid, pid, ts, ate
+
+def produtividade(session, desde, ate):
+    """({usuario_id: itens/h}, média da equipe): itens distintos em que o operador gravou lote / horas RODANDO."""
+    horas = {}
+    for uid, _, ini, fim in intervalos_trabalho(_eventos(session, desde, ate), ate):
+        horas[uid] = horas.get(uid, 0) + (fim - ini).total_seconds() / 3600
+    itens = dict(session.query(Separacao.separador_id, func.count(func.distinct(Separacao.item_id)))
+                 .filter(Separacao.registrado_em >= desde, Separacao.registrado_em <= ate).group_by(Separacao.separador_id).all())
+    # Poucos minutos RODANDO não dizem nada: a média também parte de TAXA_PADRAO e só se afasta com horas de histórico
+    total_h = sum(horas.values())
+    media = min((sum(itens.get(u, 0) for u in horas) + HORAS_PRIOR * TAXA_PADRAO) / (total_h + HORAS_PRIOR), TAXA_MAX)
+    return {u: min((itens.get(u, 0) + HORAS_PRIOR * media) / (h + HORAS_PRIOR), TAXA_MAX) for u, h in horas.items()}, media
+
+def taxas_recentes(session):
+    agora = datetime.now()
+    return _produtividade.obter_ou_calcular(int(time.time() // 300), lambda: produtividade(session, agora - JANELA_HISTORICO, agora))
+
+# --- REGRA DE ESCOLHA ---
+@dataclass
+class PedidoFila:
+    id: int
+    numero: str
+    liberado_em: datetime
+    abertos: float                  # itens em aberto (na simulação, trabalho restante)
+    equipe: float = 0.0             # itens/h somados de quem está RODANDO
+    operadores: list = field(default_factory=list)
+
+    def vagas(self): return min(math.ceil(self.abertos), EQUIPE_MAX) - len(self.operadores)
+
+def escolher_pedido(fila, taxa, agora):
+    """Pedido da `fila` para um operador parado de `taxa` itens/h; None se todos estão com a equipe completa."""
+    candidatos = [p for p in fila if p.vagas() > 0]
+    if not candidatos: return None
+    esperando = [p for p in candidatos if not p.operadores and agora - p.liberado_em > ESPERA_MAX]
+    if esperando: return min(esperando, key=lambda p: p.liberado_em)
+    return min(candidatos, key=lambda p: (p.abertos / (p.equipe + taxa), p.liberado_em))
+
+def _entrar(p, uid, taxa):
+    p.operadores.append(uid); p.equipe += taxa
+
+# --- SITUAÇÃO ATUAL ---
+def operadores_rodando(session):
+    """{usuario_id: [pedido_id, ...]} de quem tem INICIO como último evento num pedido em andamento."""
+    # O id segue a ordem de gravação: o maior id do par (pedido, usuário) é o último evento
+    ultimos = select(func.max(LogTempo.id)).join(Pedido, Pedido.id == LogTempo.pedido_id).where(Pedido.status == 'EM_ANDAMENTO').group_by(LogTempo.pedido_id, LogTempo.usuario_id)
+    rodando = {}
+    for uid, pid in session.query(LogTempo.usuario_id, LogTempo.pedido_id).filter(LogTempo.id.in_(ultimos), LogTempo.acao == "INICIO"):
+        rodando.setdefault(uid, []).append(pid)
+    return rodando
+
+def fila_separacao(session, abertos, rodando, taxas, media):
+    """{pedido_id: PedidoFila} dos pedidos em andamento, com a equipe que está RODANDO em cada um."""
+    n_abertos = {}
+    for pid, _ in abertos: n_abertos[pid] = n_abertos.get(pid, 0) + 1
+    # Pedidos de antes da coluna criado_em não têm data: entram sem prioridade por espera
+    agora = datetime.now()
+    fila = {pid: PedidoFila(pid, num, criado or agora, n_abertos.get(pid, 0))
+            for pid, num, criado in session.query(Pedido.id, Pedido.numero_pedido, Pedido.criado_em).filter(Pedido.status == 'EM_ANDAMENTO')}
+    for uid, pids in rodando.items():
+        for pid in pids:
+            # Quem roda em dois pedidos ao mesmo tempo divide a própria taxa entre eles
+            if pid in fila: _entrar(fila[pid], uid, taxas.get(uid, media) / len(pids))
+    return fila
+
+def separadores_parados(session, rodando, agora, incluir=None):
+    """Separadores no turno (algum evento de tempo em PRESENCA) que não estão RODANDO, mais `incluir` se estiver parado."""
+    presentes = {u for (u,) in session.query(LogTempo.usuario_id).join(Usuario, Usuario.id == LogTempo.usuario_id)
+                 .filter(LogTempo.timestamp >= agora - PRESENCA, Usuario.perfil.in_(["SEPARADOR", "AMBOS"])).distinct()}
+    if incluir is not None: presentes.add(incluir)
+    return [u for u in presentes if u not in rodando]
+
+def distribuir(fila, parados, taxas, media, agora):
+    """Uma passada para todos os parados: {usuario_id: (PedidoFila, motivo)}. Os mais rápidos escolhem primeiro
+    e cada escolha já ocupa a vaga para a próxima; qualquer sessão que calcule chega à mesma divisão."""
+    atribuicoes = {}
+    for uid in sorted(parados, key=lambda u: (-taxas.get(u, media), u)):
+        taxa = taxas.get(uid, media)
+        p = escolher_pedido(fila.values(), taxa, agora)
+        if not p: break
+        if not p.operadores and agora - p.liberado_em > ESPERA_MAX: motivo = f"sem separador há {(agora - p.liberado_em).total_seconds() / 3600:.0f} h"
+        else: motivo = f"termina em ~{p.abertos / (p.equipe + taxa):.1f} h com você ({len(p.operadores)} na equipe)"
+        _entrar(p, uid, taxa)
+        atribuicoes[uid] = (p, motivo)
+    return atribuicoes
+
+@dataclass
+class Sugestao:
+    pedido_id: int
+    numero: str
+    itens: list                     # ids dos itens por onde começar
+    motivo: str
+    em_andamento: list              # pedidos em que o operador está RODANDO
+
+@cronometrado("sugerir_pedido")
+def sugerir_pedido(session, usuario_id, agora=None):
+    """Próximo pedido do separador (o que ele já está rodando, se houver) e o lote de itens dele; None se não há vaga.
+    Os outros separadores parados entram na mesma distribuição: dois parados não recebem a mesma vaga nem os mesmos itens."""
+    agora = agora or datetime.now()
+    taxas, media = taxas_recentes(session)
+    rodando = operadores_rodando(session)
+    abertos = itens_abertos(session).all()
+    fila = fila_separacao(session, abertos, rodando, taxas, media)
+    if usuario_id in rodando:
+        p, motivo = fila[rodando[usuario_id][0]], "você já está trabalhando neste pedido"
+    else:
+        atribuicoes = distribuir(fila, separadores_parados(session, rodando, agora, incluir=usuario_id), taxas, media, agora)
+        if usuario_id not in atribuicoes: return None
+        p, motivo = atribuicoes[usuario_id]
+    # Itens em aberto repartidos em faixas entre a equipe (quem roda e quem acabou de ser atribuído): cada um começa por um conjunto diferente
+    equipe = sorted(set(p.operadores))
+    ids = [iid for pid, iid in abertos if pid == p.id]
+    return Sugestao(p.id, p.numero, ids[equipe.index(usuario_id)::len(equipe)][:LOTE_ITENS], motivo, rodando.get(usuario_id, []))
+
+def plano_distribuicao(session, agora=None):
+    """Pedidos em andamento (itens abertos, equipe, previsão) e o próximo pedido de cada separador parado."""
+    agora = agora or datetime.now()
+    taxas, media = taxas_recentes(session)
+    rodando = operadores_rodando(session)
+    fila = fila_separacao(session, itens_abertos(session).all(), rodando, taxas, media)
+    nomes = dict(session.query(Usuario.id, Usuario.username).filter(Usuario.perfil.in_(["SEPARADOR", "AMBOS"])).all())
+    linhas = [{"Pedido": p.numero, "Itens abertos": int(p.abertos), "Equipe": ", ".join(str(nomes.get(u, u)) for u in p.operadores),
+               "Itens/h": round(p.equipe, 1), "Previsão (h)": round(p.abertos / p.equipe, 1) if p.equipe else None}
+              for p in sorted(fila.values(), key=lambda p: p.liberado_em) if p.abertos]
+    atribuicoes = distribuir(fila, separadores_parados(session, rodando, agora), taxas, media, agora)
+    return linhas, [{"Separador": nomes.get(uid, uid), "Itens/h": round(taxas.get(uid, media), 1), "Próximo pedido": p.numero}
+                    for uid, (p, _) in atribuicoes.items()]
+
+# --- SIMULAÇÃO SOBRE O HISTÓRICO ---
+def _resumo(liberado, fim, ultimo):
+    lead = [((fim.get(p) or ultimo) - liberado[p]).total_seconds() / 3600 for p in liberado]
+    return {"lead_medio_h": round(sum(lead) / len(lead), 2), "lead_mediano_h": round(percentil(lead, 50), 2), "lead_p90_h": round(percentil(lead, 90), 2),
+            "sem_concluir": sum(1 for p in liberado if p not in fim)}
+
+def simular(session, desde, ate, passo=timedelta(minutes=1)):
+    """Reexecuta o período com a regra de distribuição e compara o lead time de separação com o registrado.
+    Capacidade: cada operador fica disponível do primeiro ao último evento de cada dia (o turno registrado);
+    o tempo parado dentro do turno, inclusive pausas, conta como livre, então a redução é um teto otimista.
+    Trabalho de cada pedido: itens/h × horas que a equipe registrou nele, de modo que a política "livre"
+    (cada um no pedido que escolheu) reproduz o histórico e a comparação usa o mesmo modelo nos dois lados.
+    Lead time: do primeiro INICIO no pedido até o fim da separação; pedido não concluído conta até o fim do período."""
+    taxas, media = produtividade(session, desde, ate)
+    def passos(ini, fim): return range(int((ini - desde) / passo), math.ceil((fim - desde) / passo))
+    agenda, liberado, turnos = {}, {}, {}   # passo -> {usuario: [pedidos registrados]}; pedido -> primeiro INICIO; (usuario, dia) -> [ini, fim]
+    for uid, pid, ini, fim in intervalos_trabalho(_eventos(session, desde, ate), ate):
+        liberado[pid] = min(liberado.get(pid, ini), ini)
+        for k in passos(ini, fim): agenda.setdefault(k, {}).setdefault(uid, []).append(pid)
+        t = turnos.setdefault((uid, ini.date()), [ini, fim]); t[0], t[1] = min(t[0], ini), max(t[1], fim)
+    if not agenda: return None
+    disponiveis = {}
+    for (uid, _), (ini, fim) in turnos.items():
+        for k in passos(ini, fim): disponiveis.setdefault(k, set()).add(uid)
+    h = passo.total_seconds() / 3600
+
+    # Política livre (histórico): define o trabalho de cada pedido e o fim registrado
+    trabalho, fim_livre = {}, {}
+    for k in sorted(agenda):
+        for uid, pids in agenda[k].items():
+            for pid in pids:
+                trabalho[pid] = trabalho.get(pid, 0) + taxas.get(uid, media) * h / len(pids)
+                fim_livre[pid] = desde + (k + 1) * passo
+    ultimo = desde + (max(agenda) + 1) * passo
+
+    # Mesma capacidade com a regra de distribuição (sem trocar quem já está num pedido, como o RODANDO)
+    numeros = dict(session.query(Pedido.id, Pedido.numero_pedido).filter(Pedido.id.in_(list(liberado))).all())
+    restante, fim_dist, atual = dict(trabalho), {}, {}
+    for k in sorted(disponiveis):
+        t = desde + k * passo
+        presentes = disponiveis[k]
+        atual = {u: p for u, p in atual.items() if u in presentes and restante[p] > 1e-9}
+        fila = {p: PedidoFila(p, numeros.get(p, str(p)), liberado[p], restante[p]) for p in liberado if liberado[p] <= t and restante[p] > 1e-9}
+        for u, p in atual.items(): _entrar(fila[p], u, taxas.get(u, media))
+        for u in sorted((u for u in presentes if u not in atual), key=lambda u: -taxas.get(u, media)):
+            p = escolher_pedido(fila.values(), taxas.get(u, media), t)
+            if p: _entrar(p, u, taxas.get(u, media)); atual[u] = p.id
+        for u, p in atual.items():
+            restante[p] -= taxas.get(u, media) * h
+            if restante[p] <= 1e-9 and p not in fim_dist: fim_dist[p] = t + passo
+
+    livre, dist = _resumo(liberado, fim_livre, ultimo), _resumo(liberado, fim_dist, ultimo)
+    return {"pedidos": len(liberado), "operadores": len({u for v in agenda.values() for u in v}), "livre": livre, "distribuido": dist,
+            "reducao_lead_medio_pct": round(100 * (1 - dist["lead_medio_h"] / livre["lead_medio_h"]), 1) if livre["lead_medio_h"] else 0.0}
+
+def main():
+    ap = argparse.ArgumentParser(description="Simula a distribuição de pedidos entre separadores sobre o histórico registrado.")
+    ap.add_argument("--desde", type=datetime.fromisoformat, help="padrão: 30 dias atrás")
+    ap.add_argument("--ate", type=datetime.fromisoformat, help="padrão: agora")
+    ap.add_argument("--passo", type=float, default=1.0, help="minutos por passo da simulação")
+    args = ap.parse_args()
+    ate = args.ate or datetime.now()
+    desde = args.desde or ate - JANELA_HISTORICO
+    s = Session()
+    try: r = simular(s, desde, ate, timedelta(minutes=args.passo))
+    finally: s.close()
+    if not r: print("Nenhum evento de tempo no período."); return
+    print(f"{r['pedidos']} pedidos, {r['operadores']} operadores, {desde:%d/%m/%Y} a {ate:%d/%m/%Y}")
+    for nome in ("livre", "distribuido"):
+        x = r[nome]
+        print(f"{nome:<12} lead médio {x['lead_medio_h']:>8.2f} h   mediano {x['lead_mediano_h']:>8.2f} h   p90 {x['lead_p90_h']:>8.2f} h   sem concluir {x['sem_concluir']}")
+    print(f"Redução prevista do lead time médio: {r['reducao_lead_medio_pct']}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# --- ESCRITA AGRUPADA (write-behind com confirmação) ---
+# Opcional (ESCRITA_AGRUPADA=1). Cliques de várias sessões (INICIO/PAUSA, bipagens) entram numa
+# fila do processo; uma thread junta o que chegou em ESCRITA_JANELA_MS e grava tudo numa única
+# transação, com inserts de várias linhas. Quem clicou espera o COMMIT do seu lote: a resposta
+# só volta depois que o evento está no banco (nada fica só na memória), mas o custo do commit
+# (fsync no PostgreSQL) é dividido pelo lote inteiro.
+# Módulo importado: a fila e a thread são únicas por processo e sobrevivem aos reruns.
+import os
+import time
+import queue
+import threading
+from modelos import Session
+
+ESCRITA_AGRUPADA = os.getenv("ESCRITA_AGRUPADA", "0") == "1"
+ESCRITA_JANELA_MS = float(os.getenv("ESCRITA_JANELA_MS", 5))
+ESCRITA_LOTE_MAX = int(os.getenv("ESCRITA_LOTE_MAX", 500))
+ESPERA_MAX_S = 30
+
+_gravadores = {}
+_fila = queue.Queue()
+_lock = threading.Lock()
+_thread = [None]
+_contadores = {"lotes": 0, "eventos": 0, "maior_lote": 0, "falhas": 0}
+
+def gravador(tipo):
+    """Registra a função que grava os envios de `tipo` na sessão do lote: fn(session, envios), sem commit.
+    A função pode preencher envio.resultado; o commit e a confirmação ficam com o agrupador."""
+    def registrar(fn):
+        _gravadores[tipo] = fn
+        return fn
+    return registrar
+
+class Envio:
+    __slots__ = ("tipo", "dados", "resultado", "erro", "pronto")
+    def __init__(self, tipo, dados):
+        self.tipo, self.dados, self.resultado, self.erro, self.pronto = tipo, dados, None, None, threading.Event()
+
+def enviar(tipo, dados):
+    """Entrega `dados` ao próximo lote e espera o commit. Devolve envio.resultado ou levanta o erro da gravação."""
+    if tipo not in _gravadores: raise ValueError(f"Tipo de escrita desconhecido: {tipo}")
+    _iniciar()
+    e = Envio(tipo, dados)
+    _fila.put(e)
+    if not e.pronto.wait(ESPERA_MAX_S): raise TimeoutError(f"Escrita agrupada sem confirmação em {ESPERA_MAX_S}s")
+    if e.erro: raise e.erro
+    return e.resultado
+
+def _iniciar():
+    with _lock:
+        if _thread[0] is None or not _thread[0].is_alive():
+            _thread[0] = threading.Thread(target=_laco, name="escrita-agrupada", daemon=True)
+            _thread[0].start()
+
+def _laco():
+    while True:
+        lote = [_fila.get()]
+        # A janela começa no primeiro envio: com pouco movimento, a espera extra é de no máximo ESCRITA_JANELA_MS
+        limite = time.monotonic() + ESCRITA_JANELA_MS / 1000.0
+        while len(lote) < ESCRITA_LOTE_MAX:
+            resta = limite - time.monotonic()
+            try: lote.append(_fila.get(timeout=resta) if resta > 0 else _fila.get_nowait())
+            except queue.Empty: break
+        _gravar(lote)
+
+def _gravar(lote):
+    s = Session()
+    try:
+        por_tipo = {}
+        for e in lote: por_tipo.setdefault(e.tipo, []).append(e)
+        for tipo, envios in por_tipo.items(): _gravadores[tipo](s, envios)
+        s.commit()
+        _contadores["lotes"] += 1; _contadores["eventos"] += len(lote); _contadores["maior_lote"] = max(_contadores["maior_lote"], len(lote))
+    except Exception as erro:
+        s.rollback(); s.close()
+        _contadores["falhas"] += 1
+        # Um envio com problema não derruba os outros: o lote é refeito um a um
+        if len(lote) > 1:
+            for e in lote: _gravar([e])
+            return
+        lote[0].erro = erro
+    finally: s.close()
+    for e in lote: e.pronto.set()
+
+def estatisticas():
+    c = dict(_contadores)
+    c["media_lote"] = round(c["eventos"] / c["lotes"], 1) if c["lotes"] else 0.0
+    return c
@@ -0,0 +1,115 @@
+# --- EXPORTAÇÃO COLUNAR DO HISTÓRICO PARA BI (Parquet / CSV) ---
+# Lê pedidos, itens, lotes e eventos de tempo em blocos com cursor no servidor
+# (stream_results) e grava cada bloco como um RecordBatch do Arrow: a memória fica
+# limitada ao tamanho do bloco, não ao período exportado.
+# Uso pela linha de comando:
+#     python exportacao.py --saida bi/ --desde 2025-01-01 --ate 2026-01-01
+#     python exportacao.py --saida bi/ --incremental --formato csv
+import os
+import json
+import argparse
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from sqlalchemy import select, Integer, Float, Boolean, DateTime, LargeBinary
+from modelos import engine, Pedido, ItemPedido, Separacao, LogTempo
+
+LOTE_LINHAS = int(os.getenv("EXPORTACAO_LOTE", 50000))
+ARQUIVO_MARCAS = "_marcas_dagua.json"
+# Transações abertas podem gravar com horário um pouco anterior ao commit: o corte
+# incremental fica este tanto no passado para não pular linhas que ainda não apareceram.
+ATRASO_CORTE = timedelta(seconds=30)
+
+# tabela -> (colunas exportadas, coluna de data usada no período e na marca d'água)
+TABELAS = {
+    "pedidos": (Pedido.__table__.c, Pedido.criado_em),
+    "itens_pedido": (ItemPedido.__table__.c, ItemPedido.criado_em),
+    "separacoes": (Separacao.__table__.c, Separacao.registrado_em),
+    "logs_tempo": (LogTempo.__table__.c, LogTempo.timestamp),
+}
+
+def _tipo_arrow(coluna):
+    t = coluna.type
+    if isinstance(t, Boolean): return pa.bool_()
+    if isinstance(t, Integer): return pa.int64()
+    if isinstance(t, Float): return pa.float64()
+    if isinstance(t, DateTime): return pa.timestamp("us")
+    if isinstance(t, LargeBinary): return pa.binary()
+    return pa.string()
+
+def _consulta(tabela, desde, ate):
+    colunas, data = TABELAS[tabela]
+    q = select(*colunas)
+    if desde: q = q.where(data > desde)
+    if ate: q = q.where(data <= ate)
+    return q
+
+class _Escritor:
+    """Parquet (zstd) ou CSV, um RecordBatch por vez."""
+    def __init__(self, caminho, schema, formato):
+        self.w = pq.ParquetWriter(caminho, schema, compression="zstd") if formato == "parquet" else pa_csv.CSVWriter(caminho, schema)
+    def escrever(self, lote): self.w.write_batch(lote)
+    def fechar(self): self.w.close()
+
+def exportar_tabela(tabela, caminho, desde=None, ate=None, formato="parquet", lote=LOTE_LINHAS):
+    """Grava as linhas de `tabela` com data em (desde, ate]. Retorna o número de linhas."""
+    q = _consulta(tabela, desde, ate)
+    schema = pa.schema([pa.field(c.name, _tipo_arrow(c)) for c in TABELAS[tabela][0]])
+    escritor, n = _Escritor(caminho, schema, formato), 0
+    try:
+        with engine.connect() as conn:
+            resultado = conn.execution_options(stream_results=True, yield_per=lote).execute(q)
+            for bloco in resultado.partitions(lote):
+                arrays = [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*bloco), schema)]
+                escritor.escrever(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                n += len(bloco)
+    finally: escritor.fechar()
+    return n
+
+def _ler_marcas(destino):
+    try:
+        with open(os.path.join(destino, ARQUIVO_MARCAS)) as f: return {k: datetime.fromisoformat(v) for k, v in json.load(f).items()}
+    except FileNotFoundError: return {}
+
+def exportar(destino, desde=None, ate=None, formato="parquet", incremental=False, tabelas=None, lote=LOTE_LINHAS):
+    """Exporta as tabelas para `destino`, um arquivo por tabela.
+    incremental: começa na marca d'água gravada em `destino` pela exportação anterior e,
+    ao terminar, a avança até `ate` (padrão: agora menos ATRASO_CORTE)."""
+    os.makedirs(destino, exist_ok=True)
+    tabelas = tabelas or list(TABELAS)
+    marcas = _ler_marcas(destino) if incremental else {}
+    if incremental and not ate: ate = datetime.now() - ATRASO_CORTE
+    carimbo = datetime.now().strftime("%Y%m%d_%H%M%S")
+    extensao = "parquet" if formato == "parquet" else "csv"
+    resumo = []
+    for tabela in tabelas:
+        inicio = marcas.get(tabela, desde) if incremental else desde
+        caminho = os.path.join(destino, f"{tabela}_{carimbo}.{extensao}")
+        n = exportar_tabela(tabela, caminho, inicio, ate, formato, lote)
+        resumo.append({"tabela": tabela, "linhas": n, "arquivo": caminho, "bytes": os.path.getsize(caminho), "desde": inicio, "ate": ate})
+    if incremental:
+        # Tudo até o corte foi exportado (mesmo sem linhas novas): a próxima rodada começa dele
+        for tabela in tabelas: marcas[tabela] = max(marcas.get(tabela) or ate, ate)
+        tmp = os.path.join(destino, ARQUIVO_MARCAS + ".tmp")
+        with open(tmp, "w") as f: json.dump({k: v.isoformat() for k, v in marcas.items()}, f, indent=2)
+        os.replace(tmp, os.path.join(destino, ARQUIVO_MARCAS))
+    return resumo
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta pedidos, itens, lotes e eventos de tempo para Parquet/CSV (BI).")
+    ap.add_argument("--saida", required=True, help="diretório de destino")
+    ap.add_argument("--desde", type=datetime.fromisoformat, help="data inicial (exclusiva), ex. 2025-01-01")
+    ap.add_argument("--ate", type=datetime.fromisoformat, help="data final (inclusiva)")
+    ap.add_argument("--formato", choices=["parquet", "csv"], default="parquet")
+    ap.add_argument("--incremental", action="store_true", help="continua da marca d'água da exportação anterior em --saida")
+    ap.add_argument("--tabelas", nargs="+", choices=list(TABELAS))
+    ap.add_argument("--lote", type=int, default=LOTE_LINHAS, help="linhas por bloco lido/gravado")
+    args = ap.parse_args()
+    t0 = datetime.now()
+    for r in exportar(args.saida, args.desde, args.ate, args.formato, args.incremental, args.tabelas, args.lote):
+        print(f"{r['tabela']:<14}{r['linhas']:>10} linhas {r['bytes'] / 1e6:>9.2f} MB  {r['arquivo']}")
+    print(f"Concluído em {(datetime.now() - t0).total_seconds():.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# --- FILA LOCAL DE BIPAGENS (DURÁVEL, SINCRONIZAÇÃO EM LOTE) ---
+# O "Salvar" só volta para o operador depois que a bipagem está no arquivo da fila (com fsync) em FILA_DIR:
+# F5, sessão expirada ou reinício do processo não perdem nada. Uma thread do processo descarrega a fila
+# no banco em lote (a cada FILA_LOTE_MAX bipagens ou FILA_ESPERA_MAX), haja ou não sessão aberta.
+# Cada processo tem o seu arquivo, preso por um flock enquanto ele vive; o arquivo de um processo que
+# morreu (reinício, réplica recriada) é adotado pelo próximo que passar pela pasta. A chave de
+# idempotência torna seguro reenviar o que já foi gravado.
+# Limite: a fila fica no servidor, não no tablet. Ela cobre banco fora do ar, F5 e reinício do app, mas
+# uma bipagem feita com o tablet sem Wi-Fi não chega ao servidor e se perde; cada "Salvar" continua
+# sendo uma ida e volta ao servidor (sem o commit no banco).
+# Módulo importado: a fila e a thread são únicas por processo e sobrevivem aos reruns.
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from modelos import Session
+from servicos import gravar_bipagens_em_lote
+try: import fcntl
+except ImportError: fcntl = None  # Windows: cada processo só relê o próprio arquivo
+
+FILA_LOTE_MAX = int(os.getenv("FILA_LOTE_MAX", 10))  # sincroniza ao acumular este número de bipagens
+FILA_ESPERA_MAX = timedelta(seconds=30)              # ... ou quando a mais antiga passar deste tempo
+FILA_DIR = os.getenv("FILA_DIR", os.path.join(tempfile.gettempdir(), "pmp_fila"))
+INTERVALO_S = 5
+ORFA_IDADE_S = 60  # um .lock livre mais novo que isso pode ser de um processo que ainda está abrindo o seu
+
+_entradas = []
+_lock = threading.Lock()          # _entradas e o arquivo
+_descarga = threading.Lock()      # uma descarga por vez
+_estado = {"id": None, "trava": None, "thread": None}
+
+def _caminho(fid, ext): return os.path.join(FILA_DIR, f"bipagens_{fid}.{ext}")
+
+def _ler(caminho):
+    entradas = []
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                # Uma linha cortada (queda no meio da escrita) nunca foi confirmada ao operador
+                try: e = json.loads(linha)
+                except ValueError: continue
+                e['registrado_em'] = datetime.fromisoformat(e['registrado_em']); entradas.append(e)
+    except FileNotFoundError: pass
+    return entradas
+
+def _linha(e): return json.dumps({**e, 'registrado_em': e['registrado_em'].isoformat()}) + "\n"
+
+def _reescrever():
+    """Regrava o arquivo do processo com _entradas (chamar com _lock). Troca atômica: ou o antigo, ou o novo."""
+    tmp = _caminho(_estado["id"], "tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(_linha(e) for e in _entradas); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, _caminho(_estado["id"], "jsonl"))
+
+def _abrir():
+    """Cria o arquivo do processo (com o .lock preso) e inicia a thread de descarga. Chamar com _lock."""
+    if _estado["id"] is None:
+        os.makedirs(FILA_DIR, exist_ok=True)
+        _estado["id"] = uuid.uuid4().hex[:12] if fcntl else "local"
+        if fcntl:
+            _estado["trava"] = open(_caminho(_estado["id"], "lock"), "w")
+            fcntl.flock(_estado["trava"], fcntl.LOCK_EX)
+        else: _entradas.extend(_ler(_caminho(_estado["id"], "jsonl")))
+        _reescrever()
+    if _estado["thread"] is None or not _estado["thread"].is_alive():
+        _estado["thread"] = threading.Thread(target=_laco, name="fila-bipagens", daemon=True)
+        _estado["thread"].start()
+
+def _adotar_orfas():
+    """Traz para a fila deste processo as bipagens de processos que morreram sem descarregar."""
+    if not fcntl or not os.path.isdir(FILA_DIR): return
+    for nome in os.listdir(FILA_DIR):
+        if not (nome.startswith("bipagens_") and nome.endswith(".lock")): continue
+        fid = nome[len("bipagens_"):-len(".lock")]
+        trava = _caminho(fid, "lock")
+        if fid == _estado["id"]: continue
+        try:
+            if time.time() - os.path.getmtime(trava) < ORFA_IDADE_S: continue
+            f = open(trava, "r+")
+        except OSError: continue
+        try:
+            try: fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError: continue  # o dono está vivo
+            orfas = _ler(_caminho(fid, "jsonl"))
+            with _lock:
+                conhecidas = {e['chave'] for e in _entradas}
+                _entradas.extend(e for e in orfas if e['chave'] not in conhecidas)
+                if orfas: _reescrever()
+            for ext in ("jsonl", "tmp", "lock"):
+                try: os.remove(_caminho(fid, ext))
+                except FileNotFoundError: pass
+            if orfas: print(f"Fila local: {len(orfas)} bipagens adotadas de {fid}")
+        finally: f.close()
+
+def _laco():
+    while True:
+        time.sleep(INTERVALO_S)
+        try:
+            _adotar_orfas()
+            s = Session()
+            try: sincronizar(s)
+            finally: s.close()
+        except Exception as e: print(f"Erro fila local: {e}")
+
+def iniciar():
+    """Abre a fila do processo já no import do app: as bipagens órfãs sobem mesmo sem ninguém bipar."""
+    with _lock: _abrir()
+
+def enfileirar(item_id, rastreabilidade, qtd, separador_id):
+    """Guarda a bipagem no arquivo da fila (fsync antes de voltar) e devolve a entrada."""
+    e = {"chave": uuid.uuid4().hex, "item_id": item_id, "rastreabilidade": rastreabilidade, "qtd": float(qtd), "separador_id": separador_id, "registrado_em": datetime.now()}
+    with _lock:
+        _abrir()
+        with open(_caminho(_estado["id"], "jsonl"), "a", encoding="utf-8") as f:
+            f.write(_linha(e)); f.flush(); os.fsync(f.fileno())
+        _entradas.append(e)
+    return e
+
+def pendentes(separador_id):
+    with _lock: return [e for e in _entradas if e['separador_id'] == separador_id]
+
+def remover(chave):
+    with _lock:
+        _entradas[:] = [e for e in _entradas if e['chave'] != chave]
+        _reescrever()
+
+def sincronizar(session, forcar=False):
+    """Descarrega a fila do processo se ela estiver cheia, velha ou se `forcar`. Retorna False se o banco falhar."""
+    with _lock:
+        if not _entradas: return True
+        if not forcar and len(_entradas) < FILA_LOTE_MAX and datetime.now() - _entradas[0]['registrado_em'] < FILA_ESPERA_MAX: return True
+    with _descarga:
+        with _lock: lote = list(_entradas)
+        if not lote: return True
+        try: gravar_bipagens_em_lote(session, lote)
+        except Exception as e:
+            session.rollback(); print(f"Erro sincronização: {e}")
+            return False
+        enviadas = {e['chave'] for e in lote}
+        with _lock:
+            _entradas[:] = [e for e in _entradas if e['chave'] not in enviadas]
+            _reescrever()
+    return True
@@ -0,0 +1,198 @@
+# --- MÉTRICAS DE LATÊNCIA E CONSULTAS POR AÇÃO ---
+# Módulo importado (e não re-executado a cada rerun do Streamlit): o estado
+# abaixo é compartilhado por todas as sessões do processo.
+import os
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from cache import estatisticas_caches
+
+# Limites superiores (ms) das faixas do histograma; a última faixa é "acima de".
+LIMITES_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Se definido, o texto no formato Prometheus é gravado neste arquivo (ex.: textfile collector do node_exporter).
+ARQUIVO_PROMETHEUS = os.getenv("METRICAS_ARQUIVO")
+INTERVALO_ARQUIVO = 15  # segundos entre gravações do arquivo
+
+class Histograma:
+    def __init__(self):
+        self.contagens = [0] * (len(LIMITES_MS) + 1)
+        self.total = 0
+        self.soma_ms = 0.0
+        self.max_ms = 0.0
+        self.consultas_soma = 0
+        self.consultas_max = 0
+        self.consultas_ultima = 0
+
+    def registrar(self, ms, consultas=0):
+        faixa = next((i for i, lim in enumerate(LIMITES_MS) if ms <= lim), len(LIMITES_MS))
+        self.contagens[faixa] += 1
+        self.total += 1
+        self.soma_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.consultas_soma += consultas
+        self.consultas_max = max(self.consultas_max, consultas)
+        self.consultas_ultima = consultas
+
+    def somar(self, outro):
+        """Acumula um histograma vindo de outro processo (dict de retirar_amostras)."""
+        self.contagens = [a + b for a, b in zip(self.contagens, outro["contagens"])]
+        self.total += outro["total"]; self.soma_ms += outro["soma_ms"]; self.max_ms = max(self.max_ms, outro["max_ms"])
+        self.consultas_soma += outro["consultas_soma"]; self.consultas_max = max(self.consultas_max, outro["consultas_max"])
+        self.consultas_ultima = outro["consultas_ultima"]
+
+    def percentil(self, p):
+        """Limite superior da faixa que contém o percentil `p` (0-100)."""
+        if not self.total: return 0.0
+        alvo, acum = self.total * p / 100.0, 0
+        for i, n in enumerate(self.contagens):
+            acum += n
+            if acum >= alvo: return float(LIMITES_MS[i]) if i < len(LIMITES_MS) else self.max_ms
+        return self.max_ms
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) exato de uma lista de amostras, pelo posto mais próximo."""
+    v = sorted(valores)
+    return v[min(len(v) - 1, max(0, int(round(p / 100.0 * len(v) + 0.5)) - 1))] if v else 0.0
+
+_lock = threading.Lock()
+_latencias = {}
+_banco = {"consultas": 0, "tempo_ms": 0.0}
+
+# Cada sessão do Streamlit roda o script na sua própria thread: o contador
+# por thread permite atribuir as consultas à execução/ação corrente.
+_thread = threading.local()
+
+def consultas_thread():
+    return getattr(_thread, 'consultas', 0)
+
+def registrar_consulta(ms):
+    _thread.consultas = consultas_thread() + 1
+    with _lock:
+        _banco["consultas"] += 1
+        _banco["tempo_ms"] += ms
+
+def instrumentar_engine(engine):
+    """Liga os contadores de consultas ao engine (uma única vez por engine)."""
+    if getattr(engine, '_pmp_instrumentado', False): return engine
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_pmp_t0', []).append((context, time.perf_counter()))
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        registrar_consulta((time.perf_counter() - conn.info['_pmp_t0'].pop()[1]) * 1000.0)
+    # Comando que falhou não passa pelo after_cursor_execute: sem isto a pilha ficaria com a entrada
+    # dele e os tempos seguintes da conexão sairiam errados. Só desempilha se a entrada for deste comando
+    # (o erro pode vir antes do _antes, por exemplo da fila de escrita do SQLite).
+    @event.listens_for(engine, "handle_error")
+    def _erro(ctx):
+        pilha = ctx.connection.info.get('_pmp_t0') if ctx.connection is not None and not ctx.connection.closed else None
+        if pilha and pilha[-1][0] is ctx.execution_context:
+            registrar_consulta((time.perf_counter() - pilha.pop()[1]) * 1000.0)
+    engine._pmp_instrumentado = True
+    return engine
+
+def registrar_latencia(acao, ms, consultas=0):
+    with _lock:
+        if acao not in _latencias: _latencias[acao] = Histograma()
+        _latencias[acao].registrar(ms, consultas)
+
+@contextmanager
+def medir(acao):
+    """Mede o bloco (tempo e consultas ao banco) e registra em `acao`, mesmo quando ele termina em st.rerun()."""
+    t0, q0 = time.perf_counter(), consultas_thread()
+    try: yield
+    finally: registrar_latencia(acao, (time.perf_counter() - t0) * 1000.0, consultas_thread() - q0)
+
+def cronometrado(acao):
+    """Decorador: mede cada chamada da função como `acao`."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envolvida(*args, **kwargs):
+            with medir(acao): return fn(*args, **kwargs)
+        return envolvida
+    return decorador
+
+def resumo_latencias():
+    linhas = []
+    with _lock:
+        for acao, h in sorted(_latencias.items()):
+            linha = {"Ação": acao, "N": h.total, "Média (ms)": round(h.soma_ms / h.total, 1), "p50": h.percentil(50), "p95": h.percentil(95), "p99": h.percentil(99), "Máx": round(h.max_ms, 1),
+                     "Consultas/exec": round(h.consultas_soma / h.total, 1), "Consultas máx": h.consultas_max, "Consultas (última)": h.consultas_ultima}
+            for i, n in enumerate(h.contagens):
+                linha[f"≤{LIMITES_MS[i]}" if i < len(LIMITES_MS) else f">{LIMITES_MS[-1]}"] = n
+            linhas.append(linha)
+    return linhas
+
+def resumo_banco():
+    with _lock: return dict(_banco)
+
+def zerar_latencias():
+    with _lock:
+        _latencias.clear()
+        _banco.update(consultas=0, tempo_ms=0.0)
+
+# --- AMOSTRAS DE OUTROS PROCESSOS (pool de tarefas) ---
+# Os processos do pool não têm tela nem arquivo Prometheus: devolvem o que mediram junto com
+# o resultado da tarefa e o processo do app soma ao próprio estado.
+def retirar_amostras():
+    """Entrega e zera tudo o que este processo mediu (dict simples, atravessa o pickle)."""
+    with _lock:
+        amostras = {"latencias": {acao: dict(vars(h)) for acao, h in _latencias.items()}, "banco": dict(_banco)}
+        _latencias.clear()
+        _banco.update(consultas=0, tempo_ms=0.0)
+    return amostras
+
+def incorporar_amostras(amostras):
+    if not amostras: return
+    with _lock:
+        for acao, h in amostras["latencias"].items():
+            if acao not in _latencias: _latencias[acao] = Histograma()
+            _latencias[acao].somar(h)
+        _banco["consultas"] += amostras["banco"]["consultas"]
+        _banco["tempo_ms"] += amostras["banco"]["tempo_ms"]
+
+# --- EXPOSIÇÃO NO FORMATO TEXTO DO PROMETHEUS ---
+def _rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"')
+
+def exportar_prometheus():
+    linhas = ["# HELP pmp_acao_duracao_segundos Duração das ações e telas do app.", "# TYPE pmp_acao_duracao_segundos histogram"]
+    with _lock:
+        itens = sorted(_latencias.items())
+        for acao, h in itens:
+            acum = 0
+            for i, n in enumerate(h.contagens):
+                acum += n
+                le = f"{LIMITES_MS[i] / 1000.0:g}" if i < len(LIMITES_MS) else "+Inf"
+                linhas.append(f'pmp_acao_duracao_segundos_bucket{{acao="{_rotulo(acao)}",le="{le}"}} {acum}')
+            linhas.append(f'pmp_acao_duracao_segundos_sum{{acao="{_rotulo(acao)}"}} {h.soma_ms / 1000.0:.6f}')
+            linhas.append(f'pmp_acao_duracao_segundos_count{{acao="{_rotulo(acao)}"}} {h.total}')
+        linhas += ["# HELP pmp_acao_consultas_total Consultas SQL executadas dentro de cada ação.", "# TYPE pmp_acao_consultas_total counter"]
+        linhas += [f'pmp_acao_consultas_total{{acao="{_rotulo(acao)}"}} {h.consultas_soma}' for acao, h in itens]
+        linhas += ["# HELP pmp_acao_consultas_ultima Consultas SQL na última execução de cada ação.", "# TYPE pmp_acao_consultas_ultima gauge"]
+        linhas += [f'pmp_acao_consultas_ultima{{acao="{_rotulo(acao)}"}} {h.consultas_ultima}' for acao, h in itens]
+        linhas += ["# HELP pmp_db_consultas_total Consultas SQL executadas pelo processo.", "# TYPE pmp_db_consultas_total counter", f"pmp_db_consultas_total {_banco['consultas']}",
+                   "# HELP pmp_db_tempo_segundos_total Tempo gasto em consultas SQL.", "# TYPE pmp_db_tempo_segundos_total counter", f"pmp_db_tempo_segundos_total {_banco['tempo_ms'] / 1000.0:.6f}"]
+    caches = estatisticas_caches()
+    for nome, campo, tipo in [("acertos_total", "Acertos", "counter"), ("faltas_total", "Faltas", "counter"), ("despejos_total", "Despejos", "counter"), ("bytes", "Bytes", "gauge"), ("itens", "Itens", "gauge")]:
+        linhas.append(f"# TYPE pmp_cache_{nome} {tipo}")
+        linhas += [f'pmp_cache_{nome}{{cache="{_rotulo(c["Cache"])}"}} {c[campo]}' for c in caches]
+    return "\n".join(linhas) + "\n"
+
+_ultima_gravacao = [0.0]
+
+def gravar_arquivo_prometheus(caminho=None, forcar=False):
+    """Grava o texto Prometheus em `caminho` (padrão: METRICAS_ARQUIVO), no máximo a cada INTERVALO_ARQUIVO segundos."""
+    caminho = caminho or ARQUIVO_PROMETHEUS
+    if not caminho: return
+    agora = time.monotonic()
+    if not forcar and agora - _ultima_gravacao[0] < INTERVALO_ARQUIVO: return
+    _ultima_gravacao[0] = agora
+    try:
+        tmp = f"{caminho}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f: f.write(exportar_prometheus())
+        os.replace(tmp, caminho)
+    except OSError as e: print(f"Erro métricas: {e}")
@@ -0,0 +1,183 @@
+# --- BANCO DE DADOS E MODELOS ---
+# Sem dependência do Streamlit: usado pelo app e pelos scripts de benchmark.
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import event, create_engine, Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, LargeBinary, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from metricas import instrumentar_engine
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///sistema_local.db")
+
+# --- MODO SQLITE (filiais que rodam numa máquina só, sem PostgreSQL) ---
+# WAL: leitores não bloqueiam o escritor nem vice-versa. busy_timeout: espera pelo lock
+# entre processos (pool de tarefas) em vez de falhar com "database is locked".
+# synchronous=NORMAL é seguro com WAL (uma queda de energia pode perder só os últimos commits).
+# Dentro do processo, as transações de escrita entram numa fila única: uma por vez,
+# por ordem de chegada, sem disputar o lock do arquivo.
+SQLITE_CONCORRENCIA = os.getenv("SQLITE_CONCORRENCIA", "1") != "0"
+SQLITE_BUSY_MS = int(os.getenv("SQLITE_BUSY_MS", 30000))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+LEITURAS = ("SELECT", "PRAGMA", "EXPLAIN")
+
+class FilaEscritaOcupada(OperationalError):
+    pass
+
+def configurar_sqlite(engine):
+    fila = threading.Lock()
+
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_conn, registro):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_MS}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.close()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _entrar_na_fila(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get('_pmp_escrita') or statement.lstrip()[:7].upper().startswith(LEITURAS): return
+        if not fila.acquire(timeout=SQLITE_BUSY_MS / 1000.0):
+            raise FilaEscritaOcupada(statement, parameters, "fila de escrita do SQLite ocupada")
+        conn.info['_pmp_escrita'] = True
+
+    # A vez só passa depois do COMMIT/ROLLBACK no arquivo (os eventos do engine rodam antes dele)
+    def _liberando(original):
+        def envolvida(dbapi_conn):
+            try: original(dbapi_conn)
+            finally:
+                try: escrevendo = dbapi_conn.info.pop('_pmp_escrita', False)
+                except NotImplementedError: escrevendo = False  # conexão da inicialização do dialeto, sem info
+                if escrevendo: fila.release()
+        return envolvida
+    engine.dialect.do_commit = _liberando(engine.dialect.do_commit)
+    engine.dialect.do_rollback = _liberando(engine.dialect.do_rollback)
+    return engine
+
+engine = create_engine(DATABASE_URL)
+if engine.dialect.name == "sqlite" and SQLITE_CONCORRENCIA and engine.url.database not in (None, "", ":memory:"): configurar_sqlite(engine)
+engine = instrumentar_engine(engine)
+Session = sessionmaker(bind=engine)
+Base = declarative_base()
+
+# --- MODELOS ---
+class Usuario(Base):
+    __tablename__ = 'usuarios'
+    id = Column(Integer, primary_key=True)
+    username = Column(String, unique=True)
+    senha = Column(String)
+    perfil = Column(String)
+    versao_token = Column(Integer, default=0)  # "Sair" incrementa: os tokens emitidos antes deixam de valer
+
+class Pedido(Base):
+    __tablename__ = 'pedidos'
+    id = Column(Integer, primary_key=True)
+    numero_pedido = Column(String, unique=True, index=True)
+    data_pedido = Column(String)
+    status = Column(String)
+    criado_em = Column(DateTime, default=datetime.now)
+    data_conclusao = Column(DateTime, nullable=True)
+    itens = relationship("ItemPedido", back_populates="pedido", cascade="all, delete")
+    logs = relationship("LogTempo", back_populates="pedido", cascade="all, delete")
+
+class ItemPedido(Base):
+    __tablename__ = 'itens_pedido'
+    id = Column(Integer, primary_key=True)
+    pedido_id = Column(Integer, ForeignKey('pedidos.id'))
+    codigo = Column(String)
+    descricao = Column(String)
+    unidade = Column(String)
+    qtd_solicitada = Column(Float)
+    justificativa_divergencia = Column(Text, nullable=True)
+    item_adicionado_manualmente = Column(Boolean, default=False)
+    criado_em = Column(DateTime, default=datetime.now)  # extras do ADM e itens novos da validação entram depois do pedido
+    pedido = relationship("Pedido", back_populates="itens")
+    separacoes = relationship("Separacao", back_populates="item", cascade="all, delete")
+
+class Separacao(Base):
+    __tablename__ = 'separacoes'
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey('itens_pedido.id'))
+    rastreabilidade = Column(String)
+    qtd_separada = Column(Float)
+    
+    # --- NOVO CAMPO: Quantidade contada pelo conferente ---
+    qtd_conferida = Column(Float, nullable=True)
+    
+    separador_id = Column(Integer, ForeignKey('usuarios.id'))
+    registrado_em = Column(DateTime, default=datetime.now)
+    enviado_conferencia = Column(Boolean, default=False)
+    conferido = Column(Boolean, default=False)
+    motivo_rejeicao = Column(Text, nullable=True)
+    enviado_sistema = Column(Boolean, default=False)
+    data_envio = Column(DateTime, nullable=True)
+    
+    # --- Contagem divergente aguardando decisão do conferente (aceitar/recusar) ---
+    # Fica no banco, não na sessão: qualquer réplica/aba mostra o alerta pendente
+    contagem_divergente = Column(Float, nullable=True)
+    
+    # --- Chave gerada no tablet: evita gravar duas vezes a mesma bipagem ---
+    chave_idempotencia = Column(String, nullable=True, unique=True, index=True)
+    item = relationship("ItemPedido", back_populates="separacoes")
+
+class LogTempo(Base):
+    __tablename__ = 'logs_tempo'
+    id = Column(Integer, primary_key=True)
+    pedido_id = Column(Integer, ForeignKey('pedidos.id'))
+    usuario_id = Column(Integer, ForeignKey('usuarios.id'))
+    acao = Column(String)
+    timestamp = Column(DateTime, default=datetime.now)
+    pedido = relationship("Pedido", back_populates="logs")
+
+# --- TAREFAS EM SEGUNDO PLANO (tarefas.py) ---
+class Tarefa(Base):
+    __tablename__ = 'tarefas'
+    id = Column(Integer, primary_key=True)
+    tipo = Column(String)
+    status = Column(String, default='PENDENTE')     # PENDENTE | EXECUTANDO | CONCLUIDA | ERRO
+    progresso = Column(Float, default=0.0)
+    mensagem = Column(String, nullable=True)
+    parametros = Column(Text, nullable=True)        # JSON
+    entrada = Column(LargeBinary, nullable=True)    # arquivo enviado; apagado ao terminar
+    resultado = Column(LargeBinary, nullable=True)    # só tarefas antigas: o arquivo gerado fica em TAREFAS_DIR
+    nome_resultado = Column(String, nullable=True)
+    erro = Column(Text, nullable=True)
+    usuario_id = Column(Integer, ForeignKey('usuarios.id'), nullable=True)
+    processo = Column(String)                       # host:pid:token do processo do app que submeteu
+    criado_em = Column(DateTime, default=datetime.now)
+    iniciado_em = Column(DateTime, nullable=True)
+    concluido_em = Column(DateTime, nullable=True)
+
+# --- CRIAÇÃO DAS TABELAS ---
+try: Base.metadata.create_all(engine)
+except: pass
+
+# --- MIGRAÇÃO DE COLUNAS NOVAS (bancos já existentes) ---
+def migrar_colunas():
+    try:
+        cols = {c['name'] for c in inspect(engine).get_columns('separacoes')}
+        with engine.begin() as conn:
+            if 'chave_idempotencia' not in cols:
+                conn.execute(text("ALTER TABLE separacoes ADD COLUMN chave_idempotencia VARCHAR"))
+            if 'contagem_divergente' not in cols:
+                conn.execute(text("ALTER TABLE separacoes ADD COLUMN contagem_divergente FLOAT"))
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_separacoes_chave_idempotencia ON separacoes (chave_idempotencia)"))
+    except Exception as e: print(f"Erro migração: {e}")
+    try:
+        if 'versao_token' not in {c['name'] for c in inspect(engine).get_columns('usuarios')}:
+            with engine.begin() as conn: conn.execute(text("ALTER TABLE usuarios ADD COLUMN versao_token INTEGER DEFAULT 0"))
+    except Exception as e: print(f"Erro migração: {e}")
+    try:
+        if 'criado_em' not in {c['name'] for c in inspect(engine).get_columns('itens_pedido')}:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE itens_pedido ADD COLUMN criado_em TIMESTAMP"))
+                # Itens já existentes: a melhor estimativa é a criação do pedido
+                conn.execute(text("UPDATE itens_pedido SET criado_em = (SELECT p.criado_em FROM pedidos p WHERE p.id = itens_pedido.pedido_id)"))
+    except Exception as e: print(f"Erro migração: {e}")
+    # Bancos antigos podem ter números repetidos: o índice fica para depois da limpeza, sem travar o resto
+    try:
+        with engine.begin() as conn: conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_pedidos_numero_pedido ON pedidos (numero_pedido)"))
+    except Exception as e: print(f"Erro migração (pedidos com número repetido?): {e}")
+
+migrar_colunas()
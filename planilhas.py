@@ -0,0 +1,74 @@
+# --- PLANILHAS (pandas / Excel) ---
+# Só o ADM usa: o app importa este módulo sob demanda, então os processos que
+# atendem apenas separadores e conferentes não carregam pandas/xlsxwriter.
+import io
+import os
+import re
+import hashlib
+import pandas as pd
+from cache import CacheDisco, CACHE_DIR
+from metricas import cronometrado
+
+# Resultado de processar_arquivo_robusto por SHA-256 do arquivo: o reenvio do mesmo
+# relatório do Crystal não passa de novo pelo pd.read_excel.
+_processados = CacheDisco("pmp_processados", os.getenv("CACHE_PMP_DIR", os.path.join(CACHE_DIR, "pmp_processados")),
+                          int(os.getenv("CACHE_PMP_BYTES", 64 * 1024 * 1024)))
+# Entra na chave do cache: incremente ao mudar processar_arquivo_robusto para não servir leituras antigas
+VERSAO_LEITOR = 1
+
+@cronometrado("processar_arquivo_robusto")
+def processar_arquivo_robusto(uploaded_file):
+    df_raw = None
+    try: df_raw = pd.read_excel(uploaded_file, header=None, dtype=str)
+    except:
+        try: uploaded_file.seek(0); content = uploaded_file.getvalue().decode('latin-1')
+        except: content = uploaded_file.getvalue().decode('utf-8')
+        df_raw = pd.DataFrame([line.split(',') for line in content.split('\n')])
+
+    data_ped, num_ped = "", "SEM_NUMERO"
+    itens = []
+    reading = False
+    reg_data = re.compile(r'(\d{2}/\d{2}/\d{4})')
+    reg_ped = re.compile(r'(?<!\d)(\d{5,6})(?!\d)')
+
+    for row in df_raw.itertuples(index=False):
+        row_clean = [str(x).strip() for x in row if str(x).lower() not in ['nan', 'none', '', 'nat']]
+        line_str = " ".join(row_clean)
+        if "Data" in line_str and not data_ped:
+            m = reg_data.search(line_str)
+            if m: data_ped = m.group(1)
+        if "Pedido" in line_str and "SEM_NUMERO" in num_ped:
+            m = reg_ped.search(line_str)
+            if m: num_ped = m.group(1)
+        if "TOTAIS" in line_str.replace(" ", "").upper(): reading = True; continue
+        if reading and len(row_clean) >= 3:
+            first = row_clean[0].replace('"', '')
+            last = row_clean[-1].replace('"', '').replace(',', '.')
+            if first.isdigit():
+                try: itens.append({"cod": first, "desc": " ".join(row_clean[1:-1]), "und": row_clean[-2] if len(row_clean)>=4 else "UN", "qtd": float(last)})
+                except: continue
+    return itens, num_ped, data_ped
+
+def ler_arquivo_pmp(conteudo, nome):
+    """processar_arquivo_robusto com cache em disco. Retorna (itens, num_ped, data_ped, veio_do_cache)."""
+    chave = f"v{VERSAO_LEITOR}-{hashlib.sha256(conteudo).hexdigest()}"
+    r = _processados.obter(chave)
+    if r: return r[0], r[1], r[2], True
+    arq = io.BytesIO(conteudo); arq.name = nome
+    itens, num_ped, data_ped = processar_arquivo_robusto(arq)
+    _processados.guardar(chave, [itens, num_ped, data_ped])
+    return itens, num_ped, data_ped, False
+
+def exportar_excel_final(det):
+    """Planilha final do pedido concluído (servicos.DetalhePedido), no formato de importação do ERP."""
+    data_xls = []
+    for d in det.itens:
+        i = d.item
+        base = {"Cod": i.codigo, "Desc": i.descricao, "Meta": d.meta, "Justificativa": i.justificativa_divergencia}
+        if not d.separacoes:
+            base.update({"Qtd": 0, "Rastreabilidade": "-", "Conferido": "NAO"}); data_xls.append(base)
+        for sp in d.separacoes:
+            ln = base.copy(); ln.update({"Qtd": sp.qtd_separada, "Qtd Conferida": sp.qtd_conferida, "Rastreabilidade": sp.rastreabilidade, "Conferido": "SIM" if sp.conferido else "NAO", "ERP": "SIM" if sp.enviado_sistema else "NAO"}); data_xls.append(ln)
+    out = io.BytesIO()
+    with pd.ExcelWriter(out, engine='xlsxwriter') as w: pd.DataFrame(data_xls).to_excel(w, index=False)
+    return out.getvalue()
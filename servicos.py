@@ -0,0 +1,257 @@
+# --- REGRAS DE NEGÓCIO DO FLUXO (importação → validação → separação → conferência → ERP → conclusão) ---
+# Sem dependência do Streamlit: as telas do app e o benchmark chamam as mesmas funções.
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import flag_modified
+from modelos import Usuario, Pedido, ItemPedido, Separacao, LogTempo
+from metricas import cronometrado
+from escrita import ESCRITA_AGRUPADA, gravador, enviar
+
+# --- TEMPOS ---
+def encerrar_cronometros_abertos(session, pedido_id):
+    logs = session.query(LogTempo).filter_by(pedido_id=pedido_id).all()
+    user_logs = {}
+    for log in logs:
+        if log.usuario_id not in user_logs: user_logs[log.usuario_id] = []
+        user_logs[log.usuario_id].append(log)
+    for uid, ulogs in user_logs.items():
+        ulogs.sort(key=lambda x: x.timestamp)
+        if ulogs and ulogs[-1].acao == "INICIO":
+            session.add(LogTempo(pedido_id=pedido_id, usuario_id=uid, acao="FIM", timestamp=datetime.now()))
+    session.commit()
+
+@cronometrado("calcular_tempos_reais")
+def calcular_tempos_reais(session, pedido_id):
+    logs = session.query(LogTempo).filter_by(pedido_id=pedido_id).order_by(LogTempo.timestamp).all()
+    tempos = {}
+    status_atual = {}
+    user_logs = {}
+    for log in logs:
+        if log.usuario_id not in user_logs: user_logs[log.usuario_id] = []
+        user_logs[log.usuario_id].append(log)
+    for uid, ulogs in user_logs.items():
+        total = timedelta(0)
+        inicio_periodo = None
+        for log in ulogs:
+            if log.acao == "INICIO":
+                inicio_periodo = log.timestamp
+                status_atual[uid] = 'RODANDO'
+            elif (log.acao == "PAUSA" or log.acao == "FIM"):
+                if inicio_periodo:
+                    total += (log.timestamp - inicio_periodo)
+                    inicio_periodo = None
+                status_atual[uid] = 'PARADO'
+        if inicio_periodo:
+            total += (datetime.now() - inicio_periodo)
+        tempos[uid] = total
+    return tempos, status_atual
+
+# --- BIPAGENS ---
+def _inserir_bipagens(session, entradas):
+    """Insere (sem commit) as bipagens ainda não gravadas. Retorna as chaves inseridas."""
+    chaves = [e['chave'] for e in entradas]
+    ja_gravadas = {c for (c,) in session.query(Separacao.chave_idempotencia).filter(Separacao.chave_idempotencia.in_(chaves))}
+    itens_validos = {i for (i,) in session.query(ItemPedido.id).filter(ItemPedido.id.in_({e['item_id'] for e in entradas}))}
+    novas = {}
+    for e in entradas:
+        if e['chave'] not in ja_gravadas and e['item_id'] in itens_validos: novas.setdefault(e['chave'], e)
+    linhas = [{"item_id": e['item_id'], "rastreabilidade": e['rastreabilidade'], "qtd_separada": e['qtd'], "separador_id": e['separador_id'],
+               "registrado_em": e['registrado_em'], "enviado_conferencia": False, "chave_idempotencia": e['chave']} for e in novas.values()]
+    if linhas: session.execute(insert(Separacao), linhas)
+    return set(novas)
+
+def gravar_bipagens_em_lote(session, entradas, _tentativa=0):
+    """Grava as bipagens da fila em uma única transação.
+    Chaves já gravadas (reenvio após queda de rede) e itens excluídos pelo ADM são ignorados.
+    Retorna a quantidade de linhas inseridas."""
+    if not entradas: return 0
+    if ESCRITA_AGRUPADA: return enviar("bipagens", entradas)
+    try:
+        inseridas = _inserir_bipagens(session, entradas)
+        session.commit()
+    except IntegrityError:
+        # Outra sessão gravou a mesma chave entre a consulta e o insert: refaz a deduplicação
+        session.rollback()
+        if _tentativa >= 2: raise
+        return gravar_bipagens_em_lote(session, entradas, _tentativa + 1)
+    return len(inseridas)
+
+def registrar_tempo(session, pedido_id, usuario_id, acao):
+    if ESCRITA_AGRUPADA: enviar("tempo", {"pedido_id": pedido_id, "usuario_id": usuario_id, "acao": acao, "timestamp": datetime.now()}); return
+    session.add(LogTempo(pedido_id=pedido_id, usuario_id=usuario_id, acao=acao)); session.commit()
+
+# Gravação dos lotes da escrita agrupada: as filas de várias sessões viram um insert de várias linhas
+@gravador("tempo")
+def _gravar_tempos(session, envios):
+    session.execute(insert(LogTempo), [e.dados for e in envios])
+
+@gravador("bipagens")
+def _gravar_bipagens(session, envios):
+    inseridas = _inserir_bipagens(session, [x for e in envios for x in e.dados])
+    for e in envios:
+        e.resultado = len({x['chave'] for x in e.dados} & inseridas)
+        inseridas -= {x['chave'] for x in e.dados}
+
+def ultimo_evento_tempo(session, pedido_id, usuario_id):
+    return session.query(LogTempo).filter_by(pedido_id=pedido_id, usuario_id=usuario_id).order_by(LogTempo.timestamp.desc()).first()
+
+# --- FLUXO DO PEDIDO ---
+def importar_pedido(session, itens, num_ped, data_ped):
+    """Cria o pedido em VALIDACAO. Retorna None se o número já existir."""
+    if session.query(Pedido).filter_by(numero_pedido=num_ped).first(): return None
+    ped = Pedido(numero_pedido=num_ped, data_pedido=data_ped, status="VALIDACAO")
+    try:
+        session.add(ped); session.flush()
+        for i in itens: session.add(ItemPedido(pedido_id=ped.id, codigo=i['cod'], descricao=i['desc'], unidade=i['und'], qtd_solicitada=i['qtd']))
+        session.commit()
+    except IntegrityError:
+        # Outra importação do mesmo pedido gravou entre a consulta e o insert (índice único em numero_pedido)
+        session.rollback()
+        return None
+    return ped
+
+def liberar_pedido(session, pval, edf):
+    """Aplica a edição da Staging Area (DataFrame do st.data_editor) e libera o pedido para a operação.
+    O diff contra o banco é calculado com operações de conjunto e gravado em lote
+    (DELETE ... WHERE id IN, UPDATE por id e INSERT multi-linha) numa única transação.
+    Linhas mantidas sem código ou com Qtd vazia/≤ 0 recusam a liberação (ValueError) em vez de gravar 0 ou ""."""
+    import pandas as pd  # só o ADM usa: não pesa nos processos dos operadores
+    campos = ["id", "codigo", "descricao", "qtd_solicitada"]
+    ed = edf.rename(columns={"ID": "id", "Código": "codigo", "Descrição": "descricao", "Qtd": "qtd_solicitada", "Manter?": "manter"})
+    ed = ed[ed["manter"].ne(False)]  # linha nova sem marcação também é mantida
+    ed = ed.assign(id=pd.to_numeric(ed["id"], errors="coerce"), codigo=ed["codigo"].fillna("").astype(str).str.strip(),
+                   descricao=ed["descricao"].fillna("").astype(str), qtd_solicitada=pd.to_numeric(ed["qtd_solicitada"], errors="coerce"))
+    # Linha nova deixada em branco é ignorada; as demais precisam de código e Qtd > 0 (célula apagada não vira 0)
+    ed = ed[~(ed["id"].isna() & (ed["codigo"] == "") & ed["qtd_solicitada"].isna() & (ed["descricao"].str.strip() == ""))]
+    invalidas = ed[(ed["codigo"] == "") | ~(ed["qtd_solicitada"] > 0)]
+    if len(invalidas):
+        linhas = [f"ID {int(r.id)}" if pd.notna(r.id) else f"nova ({r.codigo or r.descricao or 'sem código'})" for r in invalidas.itertuples()]
+        raise ValueError(f"Código vazio ou Qtd vazia/≤ 0 em {len(linhas)} linha(s): {', '.join(linhas)}. Corrija ou desmarque \"Manter?\" antes de liberar.")
+    banco = pd.DataFrame(session.query(*[getattr(ItemPedido, c) for c in campos]).filter(ItemPedido.pedido_id == pval.id).all(), columns=campos)
+    banco["descricao"] = banco["descricao"].fillna("")
+
+    existentes = ed[ed["id"].notna()].astype({"id": int}).drop_duplicates("id")
+    novos = ed[ed["id"].isna()]
+    remover = list(set(banco["id"].tolist()) - set(existentes["id"].tolist()))
+    cmp = existentes[campos].merge(banco, on="id", suffixes=("", "_banco"))
+    alterados = cmp[(cmp["codigo"] != cmp["codigo_banco"]) | (cmp["descricao"] != cmp["descricao_banco"]) | (cmp["qtd_solicitada"] != cmp["qtd_solicitada_banco"])]
+
+    if remover:
+        session.query(Separacao).filter(Separacao.item_id.in_(remover)).delete(synchronize_session=False)
+        session.query(ItemPedido).filter(ItemPedido.id.in_(remover)).delete(synchronize_session=False)
+    if len(alterados): session.execute(update(ItemPedido), alterados[campos].to_dict("records"))
+    if len(novos):
+        session.execute(insert(ItemPedido), novos.assign(pedido_id=pval.id, unidade="UN")[["pedido_id", "codigo", "descricao", "unidade", "qtd_solicitada"]].to_dict("records"))
+    pval.status = "EM_ANDAMENTO"; session.commit()
+    return {"removidos": len(remover), "alterados": len(alterados), "novos": len(novos)}
+
+# --- DETALHE DO PEDIDO (Gestão Contínua do ADM e Excel final) ---
+@dataclass
+class ItemDetalhe:
+    item: ItemPedido
+    separacoes: list
+    tot_sep: float
+    meta: float
+
+@dataclass
+class DetalhePedido:
+    pedido: Pedido
+    itens: list                 # [ItemDetalhe]
+    tempos: dict                # usuario_id -> timedelta
+    status_live: dict           # usuario_id -> 'RODANDO' | 'PARADO'
+    nomes: dict                 # usuario_id -> username
+    pendencias_lancamento: int  # lotes não recusados ainda não lançados no ERP
+    pendencias_separacao: int   # itens com saldo a separar
+
+@cronometrado("carregar_detalhe_pedido")
+def carregar_detalhe_pedido(session, pedido_id):
+    """Pedido, itens e lotes em número fixo de consultas (selectinload), com totais por item já calculados.
+    populate_existing garante dados atuais mesmo com a sessão reaproveitada entre reruns."""
+    ped = (session.query(Pedido).options(selectinload(Pedido.itens).selectinload(ItemPedido.separacoes))
+           .populate_existing().filter(Pedido.id == pedido_id).first())
+    if not ped: return None
+    tempos, status_live = calcular_tempos_reais(session, ped.id)
+    nomes = dict(session.query(Usuario.id, Usuario.username).filter(Usuario.id.in_(list(tempos))).all()) if tempos else {}
+    itens, pend_lanc, pend_sep = [], 0, 0
+    for it in ped.itens:
+        seps = list(it.separacoes)
+        tot = sum(sp.qtd_separada for sp in seps)
+        itens.append(ItemDetalhe(it, seps, tot, it.qtd_solicitada))
+        pend_lanc += sum(1 for sp in seps if not sp.motivo_rejeicao and not sp.enviado_sistema)
+        if tot < it.qtd_solicitada: pend_sep += 1
+    return DetalhePedido(ped, itens, tempos, status_live, nomes, pend_lanc, pend_sep)
+
+def itens_abertos(session):
+    """(pedido_id, item_id) dos itens de pedidos em andamento com saldo a separar (soma dos lotes < solicitado)."""
+    tot = func.coalesce(func.sum(Separacao.qtd_separada), 0)
+    return (session.query(ItemPedido.pedido_id, ItemPedido.id).join(Pedido).outerjoin(Separacao).filter(Pedido.status == 'EM_ANDAMENTO')
+            .group_by(ItemPedido.pedido_id, ItemPedido.id, ItemPedido.qtd_solicitada).having(tot < ItemPedido.qtd_solicitada)
+            .order_by(ItemPedido.pedido_id, ItemPedido.id))
+
+def pedidos_para_separacao(session):
+    """Pedidos em andamento com saldo a separar ou rascunhos/recusas pendentes (consultas agregadas, sem carregar itens e lotes)."""
+    ids = {pid for pid, _ in itens_abertos(session)}
+    ids |= {pid for (pid,) in session.query(ItemPedido.pedido_id).join(Pedido).join(Separacao).filter(
+        Pedido.status == 'EM_ANDAMENTO', or_(Separacao.enviado_conferencia == False, and_(Separacao.motivo_rejeicao != None, Separacao.motivo_rejeicao != ""))).distinct()}
+    if not ids: return []
+    return session.query(Pedido).filter(Pedido.id.in_(ids)).order_by(Pedido.id).all()
+
+def enviar_para_conferencia(session, pedido_id):
+    rascunhos = session.query(Separacao).join(ItemPedido).filter(ItemPedido.pedido_id == pedido_id, Separacao.enviado_conferencia == False).all()
+    for r in rascunhos: r.enviado_conferencia = True
+    session.commit()
+    return len(rascunhos)
+
+def aguardando_conferencia(sep):
+    # Pendente se: enviado pra conf E não conferido E não rejeitado
+    return sep.enviado_conferencia and not sep.conferido and not sep.motivo_rejeicao
+
+def pedidos_para_conferencia(session):
+    """Pedidos em andamento com lote aguardando conferência (mesma regra de aguardando_conferencia, numa consulta agregada)."""
+    ids = {pid for (pid,) in session.query(ItemPedido.pedido_id).join(Separacao).join(Pedido).filter(
+        Pedido.status == 'EM_ANDAMENTO', Separacao.enviado_conferencia == True, or_(Separacao.conferido == False, Separacao.conferido == None),
+        or_(Separacao.motivo_rejeicao == None, Separacao.motivo_rejeicao == "")).distinct()}
+    if not ids: return []
+    return session.query(Pedido).filter(Pedido.id.in_(ids)).order_by(Pedido.id).all()
+
+def registrar_divergencia(session, sep, qtd_contada):
+    """Contagem diferente da separada: fica pendente no lote até o conferente aceitar ou recusar.
+    UPDATE condicional: não reabre um lote que outro conferente acabou de decidir."""
+    (session.query(Separacao).filter(Separacao.id == sep.id, Separacao.conferido == False, Separacao.motivo_rejeicao == None)
+     .update({Separacao.contagem_divergente: qtd_contada}))
+    session.commit()
+
+def _limpar_divergencia(sep):
+    # Sempre no UPDATE: outra réplica pode ter gravado a divergência depois que este lote foi lido
+    sep.contagem_divergente = None
+    flag_modified(sep, "contagem_divergente")
+
+def aprovar_conferencia(session, sep, qtd_contada):
+    sep.qtd_conferida = qtd_contada
+    sep.conferido = True
+    _limpar_divergencia(sep)
+    sep.data_conferencia = datetime.now()
+    session.commit()
+
+def recusar_conferencia(session, sep, qtd_contada):
+    sep.motivo_rejeicao = f"Divergência de Qtd (Sep: {sep.qtd_separada} vs Conf: {qtd_contada})"
+    sep.enviado_conferencia = False
+    sep.conferido = False
+    _limpar_divergencia(sep)
+    session.commit()
+
+def marcar_lancamento_erp(session, sep, lancado):
+    sep.enviado_sistema = lancado; sep.data_envio = datetime.now() if lancado else None; session.commit()
+
+def marcar_lancamentos_erp(session, mudancas):
+    """Lança/estorna vários lotes num único UPDATE em lote: {separacao_id: lancado}."""
+    agora = datetime.now()
+    if mudancas: session.execute(update(Separacao), [{"id": sid, "enviado_sistema": lancado, "data_envio": agora if lancado else None} for sid, lancado in mudancas.items()])
+    session.commit()
+
+def concluir_pedido(session, ped):
+    encerrar_cronometros_abertos(session, ped.id)
+    ped.status = 'CONCLUIDO'; ped.data_conclusao = datetime.now(); session.commit()
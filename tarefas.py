@@ -0,0 +1,194 @@
+# --- TAREFAS EM SEGUNDO PLANO (importação, exportação, relatórios) ---
+# O trabalho pesado (pandas/Excel) roda num pool de processos, fora da thread do
+# script do Streamlit. Estado e progresso ficam na tabela `tarefas` e o arquivo gerado
+# em TAREFAS_DIR (volume compartilhado entre réplicas): qualquer sessão consulta o
+# andamento e baixa o resultado depois, até ele expirar (TAREFAS_RETENCAO_DIAS).
+# Módulo importado: o pool é único por processo e sobrevive aos reruns.
+import os
+import json
+import uuid
+import socket
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sqlalchemy.orm import defer
+from modelos import Session, Tarefa
+import metricas
+
+# Processos do pool (padrão: núcleos - 1). 0 executa na própria thread de quem submete (scripts/benchmarks).
+TAREFAS_PROCESSOS = int(os.getenv("TAREFAS_PROCESSOS", max(1, (os.cpu_count() or 2) - 1)))
+TAREFAS_DIR = os.getenv("TAREFAS_DIR", os.path.join(tempfile.gettempdir(), "pmp_tarefas"))
+TAREFAS_RETENCAO = timedelta(days=float(os.getenv("TAREFAS_RETENCAO_DIAS", 7)))
+
+# Identifica este processo do app: tarefas de um processo morto (reinício) são marcadas como ERRO.
+_HOST, _PID = socket.gethostname(), os.getpid()
+_PROCESSO = f"{_HOST}:{_PID}:{uuid.uuid4().hex[:8]}"
+
+_lock = threading.Lock()
+_pool = [None]
+_executores = {}
+
+def executor(tipo):
+    """Registra a função que executa as tarefas de `tipo`: fn(session, tarefa) -> (resultado, nome_arquivo, mensagem).
+    `resultado` em bytes é gravado em arquivo_resultado(tarefa, nome); None com nome: a função já gravou o arquivo lá."""
+    def registrar(fn):
+        _executores[tipo] = fn
+        return fn
+    return registrar
+
+def _vivo(pid):
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except OSError: pass
+    return True
+
+def recuperar_orfas(session):
+    """Tarefas pendentes deixadas por um processo deste host que já não existe (ou por uma execução anterior com o mesmo PID)."""
+    n = 0
+    for t in session.query(Tarefa).filter(Tarefa.status.in_(["PENDENTE", "EXECUTANDO"]), Tarefa.processo.like(f"{_HOST}:%"), Tarefa.processo != _PROCESSO):
+        pid = int(t.processo.split(":")[1])
+        if pid == _PID or not _vivo(pid):
+            t.status, t.erro, t.concluido_em, t.entrada = "ERRO", "Interrompida: o app foi reiniciado.", datetime.now(), None; n += 1
+    session.commit()
+    return n
+
+def _obter_pool():
+    with _lock:
+        if _pool[0] is None:
+            s = Session()
+            try: recuperar_orfas(s)
+            finally: s.close()
+            # spawn: o filho não herda o engine/conexões nem as threads do Streamlit
+            _pool[0] = ProcessPoolExecutor(max_workers=TAREFAS_PROCESSOS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool[0]
+
+def arquivo_resultado(tarefa, nome=None):
+    return os.path.join(TAREFAS_DIR, f"{tarefa.id}_{nome or tarefa.nome_resultado}")
+
+def expirar_resultados(session, agora=None):
+    """Apaga os arquivos (e blobs antigos) das tarefas concluídas há mais de TAREFAS_RETENCAO. Retorna quantas."""
+    limite = (agora or datetime.now()) - TAREFAS_RETENCAO
+    velhas = (session.query(Tarefa).options(defer(Tarefa.entrada), defer(Tarefa.resultado))
+              .filter(Tarefa.nome_resultado != None, Tarefa.concluido_em < limite).all())
+    for t in velhas:
+        try: os.remove(arquivo_resultado(t))
+        except FileNotFoundError: pass
+        t.nome_resultado, t.resultado, t.mensagem = None, None, f"{t.mensagem or ''} (resultado expirado)".strip()
+    session.commit()
+    # Sobras sem tarefa (execução interrompida no meio do arquivo)
+    if os.path.isdir(TAREFAS_DIR):
+        for nome in os.listdir(TAREFAS_DIR):
+            caminho = os.path.join(TAREFAS_DIR, nome)
+            try:
+                if datetime.fromtimestamp(os.path.getmtime(caminho)) < limite: os.remove(caminho)
+            except OSError: pass
+    return len(velhas)
+
+def submeter(session, tipo, entrada=None, parametros=None, usuario_id=None):
+    """Grava a tarefa como PENDENTE e a entrega ao pool. Retorna o id."""
+    if tipo not in _executores: raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    # Cada submissão limpa o que já passou do prazo: sem agendador à parte
+    try: expirar_resultados(session)
+    except Exception as e: session.rollback(); print(f"Erro ao expirar resultados: {e}")
+    t = Tarefa(tipo=tipo, entrada=entrada, parametros=json.dumps(parametros or {}), usuario_id=usuario_id, processo=_PROCESSO, mensagem="Na fila")
+    session.add(t); session.commit()
+    if TAREFAS_PROCESSOS <= 0: executar(t.id); return t.id
+    try: futuro = _obter_pool().submit(_executar_no_pool, t.id)
+    except BrokenProcessPool:
+        _pool[0] = None  # um processo filho morreu: recria o pool
+        futuro = _obter_pool().submit(_executar_no_pool, t.id)
+    futuro.add_done_callback(_incorporar_metricas)
+    return t.id
+
+def progresso(session, tarefa, fracao, mensagem):
+    tarefa.progresso, tarefa.mensagem = fracao, mensagem
+    session.commit()
+
+def _executar_no_pool(tarefa_id):
+    """No processo filho: executa e devolve as métricas medidas lá (tempos, consultas), que só existem nele."""
+    executar(tarefa_id)
+    return metricas.retirar_amostras()
+
+def _incorporar_metricas(futuro):
+    # Callback no processo do app: leva as medições da tarefa para a aba Desempenho e o Prometheus
+    try: metricas.incorporar_amostras(futuro.result())
+    except Exception as e: print(f"Erro métricas da tarefa: {e}")
+
+def executar(tarefa_id):
+    """Roda no processo do pool: uma sessão própria por tarefa."""
+    s = Session()
+    try:
+        t = s.get(Tarefa, tarefa_id)
+        if not t or t.status != "PENDENTE": return
+        t.status, t.iniciado_em, t.mensagem = "EXECUTANDO", datetime.now(), "Iniciada"; s.commit()
+        try:
+            os.makedirs(TAREFAS_DIR, exist_ok=True)
+            with metricas.medir(f"tarefa:{t.tipo}"): resultado, nome, mensagem = _executores[t.tipo](s, t)
+            if nome and resultado is not None:
+                with open(arquivo_resultado(t, nome), "wb") as f: f.write(resultado)
+            t.status, t.progresso, t.nome_resultado, t.mensagem = "CONCLUIDA", 1.0, nome, mensagem
+        except Exception as e:
+            s.rollback()
+            t.status, t.erro = "ERRO", str(e) or e.__class__.__name__
+        t.concluido_em, t.entrada = datetime.now(), None
+        s.commit()
+    finally: s.close()
+
+def listar_tarefas(session, tipos=None, limite=10):
+    """Tarefas mais recentes, sem carregar entrada/resultado (podem ser grandes)."""
+    q = session.query(Tarefa).options(defer(Tarefa.entrada), defer(Tarefa.resultado)).populate_existing()
+    if tipos: q = q.filter(Tarefa.tipo.in_(tipos))
+    return q.order_by(Tarefa.id.desc()).limit(limite).all()
+
+def resultado_tarefa(session, tarefa_id):
+    """Conteúdo do arquivo gerado pela tarefa (lido só no download), ou None se expirou."""
+    t = session.query(Tarefa).options(defer(Tarefa.entrada), defer(Tarefa.resultado)).filter(Tarefa.id == tarefa_id).first()
+    if not t or not t.nome_resultado: return None
+    try:
+        with open(arquivo_resultado(t), "rb") as f: return f.read()
+    except FileNotFoundError:
+        # Tarefas de antes do TAREFAS_DIR guardavam o arquivo no banco
+        return session.query(Tarefa.resultado).filter(Tarefa.id == tarefa_id).scalar()
+
+# --- EXECUTORES ---
+@executor("importar_pmp")
+def _importar_pmp(s, t):
+    from planilhas import ler_arquivo_pmp
+    from servicos import importar_pedido
+    nome = json.loads(t.parametros).get("nome", "arquivo")
+    progresso(s, t, 0.1, f"Lendo {nome}")
+    itens, num, dat, do_cache = ler_arquivo_pmp(t.entrada, nome)
+    if not itens: raise ValueError(f"Erro leitura: nenhum item encontrado em {nome}.")
+    progresso(s, t, 0.7, f"Gravando {len(itens)} itens" + (" (arquivo já lido antes)" if do_cache else ""))
+    if not importar_pedido(s, itens, num, dat): raise ValueError(f"Pedido {num} já existe.")
+    return None, None, f"Pedido {num} na Validação! ({len(itens)} itens{', arquivo já lido antes' if do_cache else ''})"
+
+@executor("exportar_excel")
+def _exportar_excel(s, t):
+    from planilhas import exportar_excel_final
+    from servicos import carregar_detalhe_pedido
+    progresso(s, t, 0.2, "Gerando planilha")
+    det = carregar_detalhe_pedido(s, json.loads(t.parametros)["pedido_id"])
+    if not det: raise ValueError("Pedido não encontrado.")
+    return exportar_excel_final(det), f"F_{det.pedido.numero_pedido}.xlsx", f"Planilha pronta ({len(det.itens)} itens)."
+
+@executor("exportar_bi")
+def _exportar_bi(s, t):
+    import shutil, zipfile
+    from exportacao import exportar
+    p = json.loads(t.parametros)
+    desde, ate = (datetime.fromisoformat(p[k]) if p.get(k) else None for k in ("desde", "ate"))
+    progresso(s, t, 0.1, "Exportando tabelas")
+    nome = f"bi_{datetime.now():%Y%m%d_%H%M%S}.zip"
+    pasta = tempfile.mkdtemp(prefix="pmp_bi_")
+    try:
+        resumo = exportar(pasta, desde, ate, p.get("formato", "parquet"))
+        # Direto no volume, sem passar pela memória; Parquet já vem comprimido (zstd): o zip só empacota
+        with zipfile.ZipFile(arquivo_resultado(t, nome), "w", zipfile.ZIP_STORED if p.get("formato", "parquet") == "parquet" else zipfile.ZIP_DEFLATED) as z:
+            for r in resumo: z.write(r["arquivo"], os.path.basename(r["arquivo"]))
+    finally: shutil.rmtree(pasta, ignore_errors=True)
+    linhas = ", ".join(f"{r['tabela']} {r['linhas']}" for r in resumo)
+    return None, nome, f"Exportação pronta ({linhas})."
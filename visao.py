@@ -0,0 +1,45 @@
+# --- LEITURA PODEROSA COM ZXING ---
+import os
+import hashlib
+from cache import criar_cache
+from metricas import cronometrado
+
+# Resultado por hash do conteúdo da foto: a mesma foto parada no camera_input
+# é decodificada uma única vez, por mais reruns que a página sofra.
+_leituras = criar_cache("leituras_codigo", int(os.getenv("CACHE_LEITURAS_BYTES", 1024 * 1024)))
+
+@cronometrado("tentar_ler_codigo_robustamente")
+def tentar_ler_codigo_robustamente(conteudo):
+    # OpenCV/ZXing (~60 MB residentes) só entram no processo na primeira foto
+    import cv2
+    import numpy as np
+    import zxingcpp
+    try:
+        file_bytes = np.frombuffer(conteudo, dtype=np.uint8)
+        img = cv2.imdecode(file_bytes, 1)
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        
+        results = zxingcpp.read_barcodes(img_rgb)
+        if results: return results[0].text
+
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        enhanced = clahe.apply(gray)
+        
+        results_gray = zxingcpp.read_barcodes(enhanced)
+        if results_gray: return results_gray[0].text
+
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        results_bin = zxingcpp.read_barcodes(binary)
+        if results_bin: return results_bin[0].text
+            
+        return None
+    except Exception as e:
+        print(f"Erro ZXing: {e}")
+        return None
+
+def ler_codigo(uploaded_image):
+    """Lê o código da foto usando o cache de leituras (compartilhado entre sessões)."""
+    conteudo = uploaded_image.getvalue()
+    chave = hashlib.sha256(conteudo).hexdigest()
+    return _leituras.obter_ou_calcular(chave, lambda: tentar_ler_codigo_robustamente(conteudo))